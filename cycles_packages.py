@@ -0,0 +1,2909 @@
+import platform
+on_macos = platform.system()=='Darwin'
+on_linux = platform.system()=='Linux'
+on_windows = platform.system()=='Windows'
+
+from typing import Callable
+
+from dataclasses import dataclass
+from typing import List
+from pathlib import Path
+
+import argparse
+
+import sys
+
+import hashlib
+import inspect
+import json
+import shutil
+from typing import Dict, Set
+
+import concurrent.futures
+import os
+import time
+from typing import Optional
+
+import io
+
+import statistics
+
+import tempfile
+
+import http.server
+
+import contextlib
+from typing import Iterator
+
+if on_windows:
+    import msvcrt
+else:
+    import fcntl
+
+import threading
+import http.client
+import urllib.parse
+import urllib.request
+import base64
+from typing import Tuple
+
+import tarfile
+import zipfile
+from typing import BinaryIO
+import posixpath
+
+import fnmatch
+
+from pathlib import PurePosixPath
+
+import collections
+from typing import Deque
+
+import re
+
+import ctypes
+import subprocess
+
+@dataclass
+class Package:
+    __slots__ = ["name", "version", "url", "local", "acquire", "get_include_dir",
+                 "get_library_dir", "patcher", "patches", "builder", "prepare_package",
+                 "dependencies", "extract_location", "install_folder", "extract_rules",
+                 "options"]
+    name : str
+    version : str
+    url : str
+    local : Path
+    acquire : Callable[..., None]
+    get_include_dir : Callable[..., str]
+    get_library_dir : Callable[..., str]
+    patcher : Callable[..., None]
+    patches : List[Path]
+    builder : Callable[..., None]
+    prepare_package: Callable[..., None]
+    dependencies : List[str]
+    extract_location : str
+    install_folder : str
+    extract_rules : List[str]
+    options : Dict[str, 'PackageOption']
+
+    def acquire_it(self):
+        if self.acquire:
+            return self.acquire(self)
+
+    def build_it(self):
+        if self.builder:
+            return self.builder(self)
+
+    def patch_it(self):
+        if self.patcher:
+            return self.patcher(self)
+
+    def prepare_it(self):
+        if self.prepare_package:
+            return self.prepare_package(self)
+
+    def install_location(self) -> Path:
+        if self.install_folder:
+            return (Path(self.extract_location) / '..' / self.install_folder).resolve()
+        return Path(self.extract_location)
+
+    def dependency(self, name : str) -> 'Artifacts':
+        if name.lower() not in [d.lower() for d in self.dependencies]:
+            raise Exception(f"{self.name} does not declare a dependency on {name}.")
+        return artifacts[name.lower()]
+
+# will gather all the different packages that exist.
+packages : List[Package] = list()
+package_registry : Dict[str, Package] = dict()
+package_creators : List[Callable[[], Package]] = list()
+
+@dataclass(frozen=True)
+class Artifacts:
+    name : str
+    version : str
+    root : str
+    include_dir : str
+    library : str
+
+artifacts : Dict[str, Artifacts] = dict()
+
+def publish_artifacts(package : Package) -> None:
+    artifacts[package.name.lower()] = Artifacts(
+        package.name,
+        package.version,
+        f"{package.install_location()}",
+        package.get_include_dir(package),
+        package.get_library_dir(package)
+    )
+
+@dataclass
+class PackageOption:
+    value : str
+    resolve : Callable[[str], str]
+
+def register_package(func : Callable[[None], Package]):
+    """Register package function"""
+    package_creators.append(func)
+
+    return func
+
+def no_patches(self : Package):
+    print(f"No patches for {self.name}")
+
+msbuild = Path(r'C:\Program Files (x86)\Microsoft Visual Studio\2019\Professional\MSBuild\Current\Bin\MSBuild.exe')
+
+current_path = Path('.').resolve()
+dl_folder = current_path / '..' / 'cycles_dependencies_dl'
+dl_folder = dl_folder.resolve()
+build_folder = current_path / '..' / 'cycles_dependencies_build'
+build_folder = build_folder.resolve()
+cache_folder = current_path / '..' / 'cycles_dependencies_cache'
+cache_folder = cache_folder.resolve()
+download_cache_folder = current_path / '..' / 'cycles_dependencies_dlcache'
+download_cache_folder = download_cache_folder.resolve()
+lock_file = current_path / 'cycles_dependencies.lock'
+log_folder = build_folder / 'logs'
+trash_folder = current_path / '..' / 'cycles_dependencies_trash'
+trash_folder = trash_folder.resolve()
+compiler_cache_folder = current_path / '..' / 'cycles_dependencies_compiler_cache'
+compiler_cache_folder = compiler_cache_folder.resolve()
+source_store_folder = current_path / '..' / 'cycles_dependencies_sources'
+source_store_folder = source_store_folder.resolve()
+patches_folder = Path(__file__).resolve().parent / 'patches'
+
+def argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clean-dl', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--clean-build', action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--cpus', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--download-jobs', type=int, default=4)
+    parser.add_argument('--build-cache', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--source-store', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--dl-cache-size', type=int, default=4096)
+    parser.add_argument('--report', type=Path, default=current_path / '..' / 'cycles_dependencies_report.json')
+    parser.add_argument('--compare', type=Path, default=None)
+    parser.add_argument('--tail', action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument('--compiler-cache', choices=['ccache', 'sccache'], default=None)
+    parser.add_argument('--multi-config', action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument('--bundles', type=Path, default=None)
+    parser.add_argument('--embree-isa', default=None)
+    parser.add_argument('--package-option', action='append', default=[], metavar='PACKAGE.OPTION=VALUE')
+    parser.add_argument('--from-bundles', type=Path, default=None)
+    parser.add_argument('--work-folder', type=Path, default=None)
+    parser.add_argument('--lock-file', type=Path, default=None)
+    parser.add_argument('--worker', type=int, default=None, metavar='PORT')
+    parser.add_argument('--workers', default=None, metavar='HOST:PORT,...')
+    parser.add_argument('--bind', default='127.0.0.1', metavar='ADDRESS')
+    parser.add_argument('--worker-build-timeout', type=float, default=4*60*60, metavar='SECONDS')
+    parser.add_argument('--plan', action='store_true')
+    parser.add_argument('--list', action='store_true')
+    parser.add_argument('packages', nargs='*')
+    return parser
+
+args = argument_parser().parse_args([])
+
+def package_option_settings() -> List[Tuple[str, str, str]]:
+    settings = list()
+    if args.embree_isa:
+        settings.append(('embree', 'isa', args.embree_isa))
+    for setting in args.package_option:
+        target, _, value = setting.partition('=')
+        package_name, _, option = target.partition('.')
+        if not option or not value:
+            raise Exception(f"Package option {setting} is not of the form PACKAGE.OPTION=VALUE.")
+        settings.append((package_name.lower(), option, value))
+    return settings
+
+def apply_package_options() -> None:
+    values = {(p.name.lower(), name): option.value for p in packages for name, option in p.options.items()}
+    for package_name, option, value in package_option_settings():
+        if (package_name, option) not in values:
+            raise Exception(f"Package {package_name} has no option {option}.")
+        values[(package_name, option)] = value
+    for p in packages:
+        for name, option in p.options.items():
+            option.value = option.resolve(values[(p.name.lower(), name)])
+
+report_lock = threading.Lock()
+build_report : Dict[str, Dict[str, float]] = dict()
+
+def add_to_report(package_name : str, field : str, value : float) -> None:
+    with report_lock:
+        fields = build_report.setdefault(package_name, dict())
+        fields[field] = fields.get(field, 0) + value
+
+@contextlib.contextmanager
+def timed(package_name : str, stage : str) -> Iterator[None]:
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        add_to_report(package_name, f'{stage}_seconds', time.monotonic() - started)
+
+def report_install_size(package : Package) -> None:
+    location = Path(package.install_location())
+    size = sum(f.stat().st_size for f in location.rglob('*') if f.is_file() and not f.is_symlink())
+    add_to_report(package.name, 'install_bytes', size)
+
+def write_report(report_path : Path, wall_seconds : float) -> Dict:
+    with report_lock:
+        package_fields = {name: dict(fields) for name, fields in build_report.items()}
+    for fields in package_fields.values():
+        if fields.get('download_seconds', 0)>0:
+            fields['download_mbps'] = fields['download_bytes'] / fields['download_seconds'] / 1_000_000
+    report = {'platform': sys.platform, 'jobs': args.jobs, 'wall_seconds': wall_seconds, 'packages': package_fields}
+    report_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+
+    print(f"Build took {wall_seconds:.1f}s, report written to {report_path}")
+    for name, fields in sorted(package_fields.items(), key=lambda item: -item[1].get('total_seconds', 0)):
+        compiles = fields.get('compiler_cache_hits', 0) + fields.get('compiler_cache_misses', 0)
+        cache_info = f", compiler cache hit rate {fields['compiler_cache_hits'] / compiles * 100:.0f}% of {compiles:.0f}" if compiles>0 else ""
+        print(f"  {name}: {fields.get('total_seconds', 0):.1f}s{cache_info}")
+    return report
+
+regression_factor = 1.2
+regression_min_seconds = 5.0
+
+def slower(before : float, after : float) -> bool:
+    return after > before * regression_factor and after - before > regression_min_seconds
+
+def compare_reports(previous : Dict, report : Dict, previous_path : Path) -> None:
+    regressions = list()
+    if slower(previous['wall_seconds'], report['wall_seconds']):
+        regressions.append(f"whole build: {previous['wall_seconds']:.1f}s -> {report['wall_seconds']:.1f}s")
+    for name, fields in sorted(report['packages'].items()):
+        before = previous['packages'].get(name, dict())
+        for field, value in sorted(fields.items()):
+            if field.endswith('_seconds') and field in before and slower(before[field], value):
+                regressions.append(f"{name} {field[:-len('_seconds')]}: {before[field]:.1f}s -> {value:.1f}s")
+        if 'download_mbps' in fields and 'download_mbps' in before and fields['download_mbps'] * regression_factor < before['download_mbps']:
+            regressions.append(f"{name} download: {before['download_mbps']:.1f} MB/s -> {fields['download_mbps']:.1f} MB/s")
+
+    if regressions:
+        print(f"Slower than in {previous_path}:")
+        for regression in regressions:
+            print(f"  {regression}")
+    else:
+        print(f"No regressions compared to {previous_path}.")
+
+def download_progress_reporter(name : str, downloaded : int, total_size : int, received : int, seconds : float) -> None:
+    throughput = received / max(seconds, 0.001) / 1_000_000
+    if total_size > -1:
+        perc = downloaded / total_size * 100
+        print(f"{name}: {downloaded} bytes ({perc:.1f}%) downloaded of {total_size}, {throughput:.1f} MB/s")
+    else:
+        print(f"{name}: {downloaded} bytes downloaded (total size unknown), {throughput:.1f} MB/s")
+
+trash_deleter = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+def folder_recursive_delete(folder : Path) -> None:
+    if not folder.exists() or not folder.is_dir():
+        return
+    trash_folder.mkdir(parents=True, exist_ok=True)
+    trashed = Path(tempfile.mkdtemp(dir=trash_folder))
+    try:
+        os.rename(folder, trashed / folder.name)
+    except OSError:
+        shutil.rmtree(folder)
+    trash_deleter.submit(shutil.rmtree, trashed, ignore_errors=True)
+
+def empty_trash() -> None:
+    if not trash_folder.exists():
+        return
+    for entry in trash_folder.iterdir():
+        trash_deleter.submit(shutil.rmtree, entry, ignore_errors=True)
+
+lock_file_lock = threading.Lock()
+url_locks : Dict[str, threading.Lock] = dict()
+
+def read_lock_file() -> Dict[str, Dict]:
+    if not lock_file.exists():
+        return dict()
+    return json.loads(lock_file.read_text())
+
+@contextlib.contextmanager
+def lock_file_exclusive() -> Iterator[None]:
+    with lock_file_lock, open(lock_file.with_name(f'{lock_file.name}.lck'), 'a+b') as guard:
+        if on_windows:
+            guard.seek(0)
+            msvcrt.locking(guard.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                guard.seek(0)
+                msvcrt.locking(guard.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(guard.fileno(), fcntl.LOCK_EX)
+            yield
+
+def record_in_lock_file(url : str, sha256 : str, size : int) -> None:
+    with lock_file_exclusive():
+        locked = read_lock_file()
+        locked[url] = {'sha256': sha256, 'size': size}
+        updated = lock_file.with_name(f'{lock_file.name}.{os.getpid()}.tmp')
+        updated.write_text(json.dumps(locked, indent=2, sort_keys=True) + '\n')
+        os.replace(updated, lock_file)
+
+connection_pool_lock = threading.Lock()
+idle_connections : Dict[Tuple[str, str], List[http.client.HTTPConnection]] = dict()
+
+def proxy_for(scheme : str, netloc : str) -> Optional[urllib.parse.SplitResult]:
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(netloc):
+        return None
+    return urllib.parse.urlsplit(proxy if '://' in proxy else f'http://{proxy}')
+
+def proxy_headers(proxy : urllib.parse.SplitResult) -> Dict[str, str]:
+    if proxy.username is None:
+        return dict()
+    credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+    return {'Proxy-Authorization': f"Basic {base64.b64encode(credentials.encode('utf-8')).decode('ascii')}"}
+
+def new_connection(scheme : str, netloc : str, proxy : Optional[urllib.parse.SplitResult]) -> http.client.HTTPConnection:
+    if proxy is None:
+        if scheme=='https':
+            return http.client.HTTPSConnection(netloc, timeout=60)
+        return http.client.HTTPConnection(netloc, timeout=60)
+    proxy_netloc = proxy.netloc.rpartition('@')[2]
+    if scheme=='https':
+        connection = http.client.HTTPSConnection(proxy_netloc, timeout=60)
+        connection.set_tunnel(netloc, headers=proxy_headers(proxy))
+        return connection
+    return http.client.HTTPConnection(proxy_netloc, timeout=60)
+
+def release_connection(scheme : str, netloc : str, connection : http.client.HTTPConnection, response : http.client.HTTPResponse) -> None:
+    if not response.isclosed() or response.will_close or response.length:
+        connection.close()
+        return
+    with connection_pool_lock:
+        idle_connections.setdefault((scheme, netloc), list()).append(connection)
+
+def open_url(url : str, headers : Dict[str, str]) -> Tuple[http.client.HTTPResponse, Callable[[], None]]:
+    headers = {'User-Agent': f'Python-urllib/{sys.version_info[0]}.{sys.version_info[1]}', **headers}
+    for redirect in range(10):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        proxy = proxy_for(parts.scheme, parts.netloc)
+        request_headers = headers
+        if proxy is not None and parts.scheme=='http':
+            path = f'http://{parts.netloc}{path}'
+            request_headers = {**headers, **proxy_headers(proxy)}
+        with connection_pool_lock:
+            idle = idle_connections.get((parts.scheme, parts.netloc))
+            connection = idle.pop() if idle else None
+        try:
+            if connection is None:
+                raise ConnectionError()
+            connection.request('GET', path, headers=request_headers)
+            response = connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            if connection is not None:
+                connection.close()
+            connection = new_connection(parts.scheme, parts.netloc, proxy)
+            connection.request('GET', path, headers=request_headers)
+            response = connection.getresponse()
+
+        def release(scheme=parts.scheme, netloc=parts.netloc, connection=connection, response=response) -> None:
+            release_connection(scheme, netloc, connection, response)
+
+        if response.status in [301, 302, 303, 307, 308]:
+            response.read()
+            release()
+            url = urllib.parse.urljoin(url, response.getheader('Location'))
+            continue
+        if response.status not in [200, 206, 416]:
+            response.read()
+            release()
+            raise Exception(f"Downloading {url} failed: {response.status} {response.reason}")
+        return response, release
+    raise Exception(f"Too many redirects while downloading {url}")
+
+download_chunk_size = 16 * 1024 * 1024
+download_connections = 4
+
+class DownloadStream:
+    def __init__(self, package : Package, locked : Optional[Dict], sequential : bool):
+        self.package = package
+        self.locked = locked
+        self.partial = download_cache_folder / f"{hashlib.sha256(package.url.encode('utf-8')).hexdigest()}.part"
+        self.ranges_file = self.partial.with_name(f'{self.partial.name}.json')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.received = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.response = None
+        self.release = None
+        self.resume_file = None
+        self.partial_file = None
+        self.ranged = False
+        self.sequential = sequential
+        self.existing = 0
+
+        if self.ranges_file.exists():
+            if not sequential:
+                ranges_state = json.loads(self.ranges_file.read_text())
+                self.total_size = ranges_state['total_size']
+                self.ranged = True
+                return
+            self.ranges_file.unlink()
+            self.partial.unlink(missing_ok=True)
+
+        self.existing = self.partial.stat().st_size if self.partial.exists() else 0
+        headers = {'Range': f'bytes={self.existing}-'} if self.existing>0 else dict()
+        self.response, self.release = open_url(package.url, headers)
+        if self.response.status==206:
+            print(f"Resuming download of {package.name} at {self.existing} bytes.")
+            self.total_size = int(self.response.getheader('Content-Range').split('/')[-1])
+        elif self.response.status==416:
+            self.response.read()
+            self.release()
+            self.response = None
+            self.total_size = self.existing
+        else:
+            self.existing = 0
+            self.total_size = int(self.response.getheader('Content-Length', -1))
+        if self.locked and self.total_size>-1 and self.total_size!=self.locked['size']:
+            self.close()
+            raise Exception(f"Download of {package.name} from {package.url} does not have the size recorded in {lock_file.name}.")
+
+        accepts_ranges = self.response is not None and (self.response.status==206 or self.response.getheader('Accept-Ranges', '')=='bytes')
+        if not sequential and accepts_ranges and self.total_size - self.existing > download_chunk_size:
+            self.close()
+            self.ranged = True
+            return
+
+        if self.existing>0:
+            self.resume_file = open(self.partial, 'rb')
+        self.partial_file = open(self.partial, 'ab' if self.existing>0 else 'wb')
+
+    def read(self, size : int = -1) -> bytes:
+        if self.resume_file:
+            block = self.resume_file.read(min(size, self.existing - self.size) if size>0 else self.existing - self.size)
+            if block:
+                self.sha256.update(block)
+                self.size += len(block)
+                return block
+            self.resume_file.close()
+            self.resume_file = None
+        if self.response is None:
+            return b''
+        block = self.response.read(size)
+        if not block:
+            self.release()
+            self.response = None
+            if self.total_size>-1 and self.size<self.total_size:
+                raise Exception(f"Download of {self.package.name} ended after {self.size} of {self.total_size} bytes.")
+            return block
+        self.sha256.update(block)
+        self.partial_file.write(block)
+        self.size += len(block)
+        self.received += len(block)
+        if time.monotonic() - self.last_report > 2.0:
+            download_progress_reporter(self.package.name, self.size, self.total_size, self.received, time.monotonic() - self.started)
+            self.last_report = time.monotonic()
+        if self.locked and self.size>self.locked['size']:
+            raise Exception(f"Download of {self.package.name} from {self.package.url} is larger than recorded in {lock_file.name}.")
+        return block
+
+    def close(self) -> None:
+        for f in [self.resume_file, self.partial_file]:
+            if f:
+                f.close()
+        if self.response is not None:
+            self.response.close()
+            self.release()
+            self.response = None
+
+    def finish(self) -> Path:
+        if self.ranged:
+            self.received = download_in_ranges(self.package, self.partial, self.ranges_file, self.total_size, self.existing)
+            with open(self.partial, 'rb') as partial_file:
+                for block in iter(lambda: partial_file.read(1024 * 1024), b''):
+                    self.sha256.update(block)
+                    self.size += len(block)
+        else:
+            while self.read(64 * 1024):
+                pass
+        self.close()
+        seconds = time.monotonic() - self.started
+        download_progress_reporter(self.package.name, self.size, self.total_size, self.received, seconds)
+        add_to_report(self.package.name, 'download_bytes', self.received)
+        add_to_report(self.package.name, 'fetch_seconds' if self.sequential else 'download_seconds', seconds)
+    
+        digest = self.sha256.hexdigest()
+        if self.locked and (digest!=self.locked['sha256'] or self.size!=self.locked['size']):
+            self.partial.unlink()
+            self.ranges_file.unlink(missing_ok=True)
+            raise Exception(f"Download of {self.package.name} from {self.package.url} does not match the sha256 recorded in {lock_file.name}.")
+        if not self.locked:
+            record_in_lock_file(self.package.url, digest, self.size)
+            print(f"Recorded sha256 {digest} for {self.package.name} in {lock_file.name}.")
+    
+        cached = download_cache_folder / digest
+        os.replace(self.partial, cached)
+        self.ranges_file.unlink(missing_ok=True)
+        return cached
+
+def download_in_ranges(package : Package, partial : Path, ranges_file : Path, total_size : int, existing : int) -> int:
+    chunk_count = (total_size + download_chunk_size - 1) // download_chunk_size
+    if ranges_file.exists():
+        done = set(json.loads(ranges_file.read_text())['done'])
+    else:
+        done = set(range(existing // download_chunk_size))
+        with open(partial, 'ab') as partial_file:
+            partial_file.truncate(total_size)
+    missing = [i for i in range(chunk_count) if i not in done]
+    progress = {'size': (chunk_count - len(missing)) * download_chunk_size, 'received': 0, 'started': time.monotonic(), 'last_report': time.monotonic()}
+    state_lock = threading.Lock()
+
+    def fetch_chunk(index : int) -> None:
+        start = index * download_chunk_size
+        end = min(start + download_chunk_size, total_size) - 1
+        response, release = open_url(package.url, {'Range': f'bytes={start}-{end}'})
+        if response.status!=206:
+            response.close()
+            release()
+            raise Exception(f"Range request for {package.name} not honoured.")
+        received = 0
+        with open(partial, 'r+b') as partial_file:
+            partial_file.seek(start)
+            while True:
+                block = response.read(64 * 1024)
+                if not block:
+                    break
+                partial_file.write(block)
+                received += len(block)
+        release()
+        if received!=end - start + 1:
+            raise Exception(f"Range {start}-{end} of {package.name} incomplete.")
+        with state_lock:
+            done.add(index)
+            ranges_file.write_text(json.dumps({'total_size': total_size, 'done': sorted(done)}))
+            progress['size'] += received
+            progress['received'] += received
+            if time.monotonic() - progress['last_report'] > 2.0:
+                download_progress_reporter(package.name, progress['size'], total_size, progress['received'], time.monotonic() - progress['started'])
+                progress['last_report'] = time.monotonic()
+
+    ranges_file.write_text(json.dumps({'total_size': total_size, 'done': sorted(done)}))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=download_connections) as executor:
+        for chunk in executor.map(fetch_chunk, missing):
+            pass
+    return progress['received']
+
+def download_to_cache(package : Package, consume : Optional[Callable[[BinaryIO], None]] = None) -> Path:
+    url = package.url
+    with lock_file_lock:
+        url_lock = url_locks.setdefault(url, threading.Lock())
+    with url_lock:
+        with lock_file_lock:
+            locked = read_lock_file().get(url)
+        if locked:
+            cached = download_cache_folder / locked['sha256']
+            if cached.exists() and cached.stat().st_size==locked['size']:
+                os.utime(cached)
+                print(f"{package.name} ({url}) found in download cache.")
+                if consume:
+                    with open(cached, 'rb') as cached_file:
+                        consume(cached_file)
+                return cached
+
+        download_cache_folder.mkdir(parents=True, exist_ok=True)
+        stream = DownloadStream(package, locked, consume is not None)
+        try:
+            if consume:
+                consume(stream)
+            cached = stream.finish()
+        finally:
+            stream.close()
+        evict_from_download_cache(args.dl_cache_size * 1024 * 1024, cached)
+        return cached
+
+def evict_from_download_cache(max_size : int, keep : Path) -> None:
+    entries = [e for e in download_cache_folder.iterdir() if e.is_file() and e.suffix=='']
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    total_size = sum(e.stat().st_size for e in entries)
+    for entry in entries:
+        if total_size<=max_size:
+            break
+        if entry==keep:
+            continue
+        total_size -= entry.stat().st_size
+        print(f"Evicting {entry.name} from download cache.")
+        entry.unlink()
+
+def link_from_cache(cached : Path, local : Path) -> None:
+    if local.exists():
+        if local.samefile(cached):
+            return
+        local.unlink()
+    try:
+        os.link(cached, local)
+    except OSError:
+        shutil.copyfile(cached, local)
+
+zip_extract_worker = """
+import shutil
+import sys
+import zipfile
+from pathlib import Path
+
+target_folder = Path(sys.argv[2])
+with zipfile.ZipFile(sys.argv[1], mode='r') as archive:
+    for name in sys.stdin.read().splitlines():
+        with archive.open(name) as source, open(target_folder / name, 'wb') as destination:
+            shutil.copyfileobj(source, destination)
+"""
+
+zip_members_per_worker = 1000
+
+def extract_zip_members(package_name : str, archive_path : Path, archive : zipfile.ZipFile, target_folder : Path, wanted : Callable[[str], bool]) -> None:
+    members = [m for m in archive.infolist() if wanted(m.filename)]
+    for member in members:
+        parts = PurePosixPath(member.filename).parts
+        if member.filename.startswith('/') or '..' in parts:
+            raise Exception(f"Refusing to extract {member.filename} from {archive_path}.")
+
+    files = [m.filename for m in members if not m.is_dir()]
+    wanted_workers = min(args.cpus, len(files) // zip_members_per_worker)
+    if wanted_workers<=1:
+        archive.extractall(target_folder, members=members)
+        return
+
+    folders = {target_folder / m.filename for m in members if m.is_dir()}
+    folders.update((target_folder / name).parent for name in files)
+    for folder in sorted(folders):
+        folder.mkdir(parents=True, exist_ok=True)
+
+    with cpu_slots(package_name, wanted_workers) as workers:
+        processes = list()
+        for worker in range(workers):
+            process = subprocess.Popen([sys.executable, '-c', zip_extract_worker, f"{archive_path}", f"{target_folder}"],
+                                       stdin=subprocess.PIPE, encoding='utf-8')
+            process.stdin.write('\n'.join(files[worker::workers]))
+            process.stdin.close()
+            processes.append(process)
+
+        failed = [p for p in processes if p.wait()!=0]
+    if len(failed)>0:
+        raise Exception(f"Extracting {archive_path} failed in {len(failed)} of {workers} workers.")
+
+def extract_rules_allow(rules : List[str], name : str) -> bool:
+    name = name.rstrip('/')
+    for rule in rules:
+        kind, pattern = rule.split(' ', 1)
+        if fnmatch.fnmatchcase(name, pattern):
+            return kind=='+'
+    return True
+
+def tar_member_safe(member : tarfile.TarInfo) -> bool:
+    if member.name.startswith('/') or '..' in member.name.split('/'):
+        return False
+    if member.issym() or member.islnk():
+        if member.linkname.startswith('/'):
+            return False
+        target = member.linkname if member.islnk() else posixpath.join(posixpath.dirname(member.name), member.linkname)
+        target = posixpath.normpath(target)
+        return target!='..' and not target.startswith('../')
+    return True
+
+def download_and_extract_package(package : Package) -> None:
+    dep_local = package.local
+    staging = None
+
+    def wanted(name : str) -> bool:
+        return extract_rules_allow(package.extract_rules, name)
+
+    def staging_folder(top_level : bool) -> Path:
+        nonlocal staging
+        build_folder.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=build_folder, prefix=f'{package.extract_location.name}.'))
+        return staging if top_level else staging / package.extract_location.name
+
+    def move_into_place() -> None:
+        extracted = staging / package.extract_location.name
+        extracted.mkdir(exist_ok=True)
+        os.rename(extracted, package.extract_location)
+
+    def extract_tar_stream(fileobj : BinaryIO) -> None:
+        stage = contextlib.nullcontext() if isinstance(fileobj, DownloadStream) else timed(package.name, 'extract')
+        with stage, tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+            target_folder = None
+            prefix = ''
+            for member in archive:
+                if target_folder is None:
+                    package.extract_location = build_folder / (member.name if member.isdir() else dep_local.stem)
+                    if package.extract_location.exists():
+                        print(f"Archive {dep_local} already extracted.")
+                        return
+                    print(f"extracting {dep_local}...")
+                    target_folder = staging_folder(member.isdir())
+                    prefix = f'{member.name}/' if member.isdir() else ''
+                if not tar_member_safe(member):
+                    raise Exception(f"Refusing to extract {member.name} from {dep_local}.")
+                if wanted(member.name[len(prefix):] if member.name.startswith(prefix) else member.name):
+                    archive.extract(member, target_folder)
+            print(f"... extracting {dep_local} complete.")
+
+    def extract_zip(archive : zipfile.ZipFile) -> bool:
+        names = archive.namelist()
+        top_level = names[0].split('/')[0]
+        has_top_level = all(name.startswith(f'{top_level}/') for name in names)
+        package.extract_location = build_folder / (top_level if has_top_level else dep_local.stem)
+        prefix = f'{top_level}/' if has_top_level else ''
+
+        if not package.extract_location.exists():
+            print(f"extracting {dep_local}...")
+            target_folder = staging_folder(has_top_level)
+            with timed(package.name, 'extract'):
+                extract_zip_members(package.name, dep_local, archive, target_folder, lambda name: wanted(name[len(prefix):]))
+            print(f"... extracting {dep_local} complete.")
+            return True
+        print(f"Archive {dep_local} already extracted.")
+        return False
+
+    if args.source_store and restore_source_tree(package):
+        return
+
+    print(f"Fetching and extracting {package.name}...")
+    try:
+        if dep_local.suffix == '.zip':
+            cached = download_to_cache(package)
+            link_from_cache(cached, dep_local)
+            with zipfile.ZipFile(dep_local, mode='r') as dep_zip:
+                extracted = extract_zip(dep_zip)
+        else:
+            cached = download_to_cache(package, extract_tar_stream)
+            link_from_cache(cached, dep_local)
+            extracted = staging is not None
+        if extracted:
+            move_into_place()
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    if args.source_store and extracted:
+        store_source_tree(package, source_tree_key(package, cached.name, False))
+
+def source_tree_key(package : Package, archive_sha256 : str, patched : bool) -> str:
+    if not patched and not package.extract_rules:
+        return archive_sha256
+    sha = hashlib.sha256(archive_sha256.encode('utf-8'))
+    for rule in package.extract_rules:
+        sha.update(rule.encode('utf-8'))
+    for patch_file in package.patches if patched else []:
+        sha.update(hashlib.sha256(patch_file.read_bytes()).digest())
+    return sha.hexdigest()
+
+def link_tree(source : Path, target : Path, copy : bool) -> None:
+    for folder, folder_names, file_names in os.walk(source):
+        relative = Path(folder).relative_to(source)
+        (target / relative).mkdir(parents=True, exist_ok=True)
+        for name in list(folder_names) + file_names:
+            path = Path(folder) / name
+            if path.is_symlink():
+                os.symlink(os.readlink(path), target / relative / name)
+            elif path.is_file():
+                if copy:
+                    shutil.copy2(path, target / relative / name)
+                    continue
+                try:
+                    os.link(path, target / relative / name)
+                except OSError:
+                    shutil.copy2(path, target / relative / name)
+        folder_names[:] = [name for name in folder_names if not (Path(folder) / name).is_symlink()]
+
+def store_source_tree(package : Package, key : str) -> None:
+    entry = source_store_folder / key
+    if entry.exists():
+        return
+    source_store_folder.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=source_store_folder, prefix=f'{key}.'))
+    link_tree(Path(package.extract_location), staging / 'tree', package.install_folder=='')
+    entry_info = {
+        'name': package.name,
+        'version': package.version,
+        'extract_folder': Path(package.extract_location).name
+    }
+    (staging / 'entry.json').write_text(json.dumps(entry_info, indent=2))
+    try:
+        os.rename(staging, entry)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+    print(f"{package.name} sources stored in source store.")
+
+def restore_source_tree(package : Package) -> bool:
+    archive_sha256 = locked_archive_sha256(package)
+    if not archive_sha256:
+        return False
+    for patched in ([True, False] if package.patches else [False]):
+        entry = source_store_folder / source_tree_key(package, archive_sha256, patched)
+        if not (entry / 'entry.json').exists():
+            continue
+        entry_info = json.loads((entry / 'entry.json').read_text())
+        package.extract_location = build_folder / entry_info['extract_folder']
+        if package.extract_location.exists():
+            print(f"{package.name} sources already in place.")
+            return True
+        build_folder.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=build_folder, prefix=f'{entry_info["extract_folder"]}.'))
+        with timed(package.name, 'extract'):
+            link_tree(entry / 'tree', staging, package.install_folder=='')
+        os.rename(staging, package.extract_location)
+        if patched:
+            for patch_file in package.patches:
+                patch_applied_marker(patch_file).touch()
+                verified_patches.add(patch_file)
+        os.utime(entry)
+        print(f"{package.name} sources linked from source store{' with patches applied' if patched else ''}.")
+        return True
+    return False
+
+debug_postfix = '_d'
+
+def cmake_configs() -> List[str]:
+    return ['Release', 'Debug'] if args.multi_config else ['Release']
+
+def cmake_platform_args() -> List[str]:
+    if args.multi_config:
+        multi_config = [
+            f"-DCMAKE_CONFIGURATION_TYPES={';'.join(cmake_configs())}",
+            f'-DCMAKE_DEBUG_POSTFIX={debug_postfix}'
+        ]
+        if on_windows:
+            return ['-G', 'Visual Studio 16 2019', *multi_config]
+        return [
+            '-G',
+            'Ninja Multi-Config',
+            *multi_config,
+            *([] if on_macos else ['-DCMAKE_POSITION_INDEPENDENT_CODE=ON', '-DCMAKE_INSTALL_LIBDIR=lib'])
+        ]
+    if on_windows:
+        return ['-G', 'Visual Studio 16 2019']
+    if on_macos:
+        return ['-G', 'Unix Makefiles']
+    return [
+        '-G',
+        'Ninja',
+        '-DCMAKE_BUILD_TYPE=Release',
+        '-DCMAKE_POSITION_INDEPENDENT_CODE=ON',
+        '-DCMAKE_INSTALL_LIBDIR=lib'
+    ]
+
+def compiler_cache_cmake_args() -> List[str]:
+    if not args.compiler_cache:
+        return []
+    return [
+        f'-DCMAKE_C_COMPILER_LAUNCHER={args.compiler_cache}',
+        f'-DCMAKE_CXX_COMPILER_LAUNCHER={args.compiler_cache}'
+    ]
+
+def compiler_cache_environment(stats_log : Path) -> Optional[Dict[str, str]]:
+    if not args.compiler_cache:
+        return None
+    env = dict(os.environ)
+    env['CCACHE_DIR'] = f"{compiler_cache_folder / 'ccache'}"
+    env['CCACHE_BASEDIR'] = f"{build_folder}"
+    env['CCACHE_STATSLOG'] = f"{stats_log}"
+    env['SCCACHE_DIR'] = f"{compiler_cache_folder / 'sccache'}"
+    return env
+
+def report_compiler_cache_stats(package_name : str, stats_log : Path) -> None:
+    if not stats_log.exists():
+        return
+    results = [line.strip() for line in stats_log.read_text().splitlines() if line.strip() and not line.startswith('#')]
+    add_to_report(package_name, 'compiler_cache_hits', sum(1 for r in results if r.endswith('_cache_hit')))
+    add_to_report(package_name, 'compiler_cache_misses', sum(1 for r in results if r=='cache_miss'))
+    stats_log.unlink()
+
+def check_compiler_cache() -> None:
+    if args.compiler_cache and on_windows:
+        raise Exception("--compiler-cache needs the Makefile or Ninja generators, and on Windows the packages are built with Visual Studio.")
+    if args.compiler_cache and shutil.which(args.compiler_cache) is None:
+        raise Exception(f"Compiler cache {args.compiler_cache} not found on the PATH.")
+
+def print_compiler_cache_stats() -> None:
+    if args.compiler_cache=='sccache':
+        subprocess.run(['sccache', '--show-stats'], env=compiler_cache_environment(Path(os.devnull)))
+
+class CpuBudget:
+    def __init__(self, total : int):
+        self.total = max(total, 1)
+        self.free = self.total
+        self.builds = 0
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def building(self) -> Iterator[None]:
+        with self.condition:
+            self.builds += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.builds -= 1
+
+    def fair_share(self) -> int:
+        return max(self.total // max(self.builds, 1), 1)
+
+    def acquire(self, wanted : int) -> int:
+        with self.condition:
+            self.condition.wait_for(lambda: self.free>0)
+            granted = min(max(wanted, 1), self.free, self.fair_share())
+            self.free -= granted
+            return granted
+
+    def release(self, count : int) -> None:
+        with self.condition:
+            self.free += count
+            self.condition.notify_all()
+
+cpu_budget = CpuBudget(args.cpus)
+
+@contextlib.contextmanager
+def cpu_slots(package_name : str, wanted : int) -> Iterator[int]:
+    started = time.monotonic()
+    slots = cpu_budget.acquire(wanted)
+    add_to_report(package_name, 'cpu_wait_seconds', time.monotonic() - started)
+    try:
+        yield slots
+    finally:
+        cpu_budget.release(slots)
+
+log_tail_lines = 40
+log_progress_interval = 10.0
+
+@dataclass
+class LoggedProcess:
+    returncode : int
+    log_file : Path
+    tail : Deque[str]
+
+    def print_tail(self) -> None:
+        print(f"Last {len(self.tail)} lines of {self.log_file}:")
+        for line in self.tail:
+            print(line)
+
+def run_logged(package_name : str, step : str, command : List[str], cwd : Optional[Path] = None, jobs : Optional[Callable[[int], List[str]]] = None, env : Optional[Dict[str, str]] = None) -> LoggedProcess:
+    log_file = log_folder / package_name.lower() / f'{step}.log'
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    tail : Deque[str] = collections.deque(maxlen=log_tail_lines)
+    with cpu_slots(package_name, args.cpus if jobs else 1) as slots:
+        if jobs:
+            command = command + jobs(slots)
+        print(f"{package_name} {step} on {slots} cpu(s): output in {log_file}")
+        stats_log = log_file.with_suffix('.cache-stats')
+        stats_log.unlink(missing_ok=True)
+        tool_env = compiler_cache_environment(stats_log)
+        if env:
+            tool_env = {**(tool_env or os.environ), **env}
+        last_report = time.monotonic()
+        with open(log_file, 'wb') as log:
+            process = subprocess.Popen(command, cwd=cwd, env=tool_env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            for raw_line in process.stdout:
+                log.write(raw_line)
+                line = raw_line.decode('utf-8', errors='replace').rstrip()
+                tail.append(line)
+                if args.tail:
+                    print(f"[{package_name} {step}] {line}")
+                elif time.monotonic() - last_report > log_progress_interval:
+                    print(f"[{package_name} {step}] {line}")
+                    last_report = time.monotonic()
+            returncode = process.wait()
+    report_compiler_cache_stats(package_name, stats_log)
+    return LoggedProcess(returncode, log_file, tail)
+
+def cmake_jobs(slots : int) -> List[str]:
+    return ['--parallel', f'{slots}']
+
+def make_jobs(slots : int) -> List[str]:
+    return [f'-j{slots}']
+
+def msbuild_jobs(slots : int) -> List[str]:
+    return [f'/m:{slots}']
+
+@dataclass
+class Hunk:
+    header : str
+    old_start : int
+    old_lines : List[str]
+    new_lines : List[str]
+    old_no_newline : bool = False
+    new_no_newline : bool = False
+
+@dataclass
+class FilePatch:
+    path : str
+    hunks : List[Hunk]
+    created : bool = False
+    deleted : bool = False
+
+byte_order_mark = '\ufeff'
+hunk_header = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+def patch_name(name : str) -> str:
+    name = name.split('\t')[0].strip()
+    if name.startswith('"') and name.endswith('"'):
+        name = name[1:-1]
+    return name
+
+def patch_path(name : str) -> str:
+    return '/'.join(patch_name(name).split('/')[1:])
+
+def parse_patch(patch_file : Path) -> List[FilePatch]:
+    file_patches = list()
+    old_left = new_left = 0
+    old_name = ''
+    last_kind = ''
+    for number, line in enumerate(patch_file.read_bytes().decode('utf-8').split('\n'), 1):
+        line = line.rstrip('\r')
+        if line.startswith('\\') and last_kind:
+            hunk = file_patches[-1].hunks[-1]
+            hunk.old_no_newline = hunk.old_no_newline or last_kind in [' ', '-']
+            hunk.new_no_newline = hunk.new_no_newline or last_kind in [' ', '+']
+        elif old_left>0 or new_left>0:
+            hunk = file_patches[-1].hunks[-1]
+            kind, text = line[:1], line[1:]
+            if kind in [' ', '']:
+                hunk.old_lines.append(text)
+                hunk.new_lines.append(text)
+                old_left, new_left = old_left - 1, new_left - 1
+            elif kind=='-':
+                hunk.old_lines.append(text)
+                old_left -= 1
+            elif kind=='+':
+                hunk.new_lines.append(text)
+                new_left -= 1
+            else:
+                raise Exception(f"{patch_file.name}:{number}: unexpected line in hunk.")
+            last_kind = kind or ' '
+        elif line.startswith('--- '):
+            old_name = line[4:]
+        elif line.startswith('+++ '):
+            if patch_name(line[4:])=='/dev/null':
+                file_patches.append(FilePatch(patch_path(old_name), list(), deleted=True))
+            else:
+                file_patches.append(FilePatch(patch_path(line[4:]), list(), created=patch_name(old_name)=='/dev/null'))
+        elif line.startswith('@@'):
+            match = hunk_header.match(line)
+            if not match or len(file_patches)==0:
+                raise Exception(f"{patch_file.name}:{number}: malformed hunk header.")
+            old_start, old_count, _, new_count = match.groups()
+            file_patches[-1].hunks.append(Hunk(line, int(old_start), list(), list()))
+            last_kind = ''
+            old_left = int(old_count) if old_count is not None else 1
+            new_left = int(new_count) if new_count is not None else 1
+    if old_left>0 or new_left>0:
+        raise Exception(f"{patch_file.name}: last hunk is cut short.")
+    return file_patches
+
+def line_key(line : str) -> str:
+    return ' '.join(line.replace(byte_order_mark, '').split())
+
+def find_hunk(keys : List[str], old_keys : List[str], expected : int, first : int) -> int:
+    last = len(keys) - len(old_keys)
+    for distance in range(max(expected - first, last - expected) + 1):
+        for start in [expected - distance, expected + distance]:
+            if first<=start<=last and keys[start:start + len(old_keys)]==old_keys:
+                return start
+    return -1
+
+def patch_text(data : Optional[bytes], file_patch : FilePatch, patch_file : Path) -> Optional[bytes]:
+    if file_patch.created and data is not None:
+        raise Exception(f"{patch_file.name}: {file_patch.path} is created, but already exists.")
+    if file_patch.deleted and data is None:
+        raise Exception(f"{patch_file.name}: {file_patch.path} is deleted, but does not exist.")
+    text = (data or b'').decode('utf-8', errors='surrogateescape')
+    bom = text.startswith(byte_order_mark)
+    newline = '\r\n' if '\r\n' in text else '\n'
+    text = text[1:] if bom else text
+    final_newline = text.endswith('\n') or text==''
+    lines = text.replace('\r\n', '\n').split('\n')
+    if lines[-1]=='':
+        lines.pop()
+
+    keys = [line_key(line) for line in lines]
+    offset = 0
+    first = 0
+    for hunk in file_patch.hunks:
+        expected = (hunk.old_start if len(hunk.old_lines)==0 else max(hunk.old_start - 1, 0)) + offset
+        start = find_hunk(keys, [line_key(line) for line in hunk.old_lines], expected, first)
+        if start<0:
+            raise Exception(f"{patch_file.name}: {hunk.header} does not apply to {file_patch.path}.")
+        if start + len(hunk.old_lines)==len(lines):
+            final_newline = not hunk.new_no_newline
+        new_lines = [line.replace(byte_order_mark, '') for line in hunk.new_lines]
+        lines[start:start + len(hunk.old_lines)] = new_lines
+        keys[start:start + len(hunk.old_lines)] = [line_key(line) for line in new_lines]
+        offset += start - expected + len(new_lines) - len(hunk.old_lines)
+        first = start + len(new_lines)
+
+    if file_patch.deleted:
+        if len(lines)>0:
+            raise Exception(f"{patch_file.name}: {file_patch.path} is deleted, but not all of it is removed.")
+        return None
+    patched = newline.join(lines) + (newline if final_newline and lines else '')
+    return ((byte_order_mark if bom else '') + patched).encode('utf-8', errors='surrogateescape')
+
+def patched_files(patch_file : Path, read_source : Callable[[str], Optional[bytes]]) -> Dict[str, Optional[bytes]]:
+    return {fp.path: patch_text(read_source(fp.path), fp, patch_file) for fp in parse_patch(patch_file)}
+
+def tree_reader(root : Path) -> Callable[[str], Optional[bytes]]:
+    def read_source(path : str) -> Optional[bytes]:
+        source = root / path
+        return source.read_bytes() if source.exists() else None
+    return read_source
+
+def patch_applied_marker(patch_file : Path) -> Path:
+    return build_folder / f'{patch_file.name}.applied'
+
+def apply_patches(package : Package) -> None:
+    root = Path(package.extract_location)
+    applied = False
+    for patch_file in package.patches:
+        marker = patch_applied_marker(patch_file)
+        if marker.exists():
+            print(f"{patch_file.name} already applied to {package.name}.")
+            continue
+        for path, data in patched_files(patch_file, tree_reader(root)).items():
+            target = root / path
+            if data is None:
+                target.unlink()
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temporary = target.with_name(f'{target.name}.patching')
+            temporary.write_bytes(data)
+            if target.exists():
+                shutil.copymode(target, temporary)
+            os.replace(temporary, target)
+        marker.touch()
+        applied = True
+        print(f"{patch_file.name} applied to {package.name}.")
+    archive_sha256 = locked_archive_sha256(package)
+    if args.source_store and applied and archive_sha256:
+        store_source_tree(package, source_tree_key(package, archive_sha256, True))
+
+verified_patches : Set[Path] = set()
+
+def verify_package_patches(package : Package, read_source : Callable[[str], Optional[bytes]]) -> None:
+    for patch_file in package.patches:
+        if patch_file in verified_patches or patch_applied_marker(patch_file).exists():
+            continue
+        patched_files(patch_file, read_source)
+        verified_patches.add(patch_file)
+
+def cached_archive(package : Package) -> Optional[Path]:
+    with lock_file_lock:
+        locked = read_lock_file().get(package.url)
+    if not locked:
+        return None
+    cached = download_cache_folder / locked['sha256']
+    if not cached.exists() or cached.stat().st_size!=locked['size']:
+        return None
+    return cached
+
+def locked_archive_sha256(package : Package) -> Optional[str]:
+    with lock_file_lock:
+        locked = read_lock_file().get(package.url)
+    return locked['sha256'] if locked else None
+
+def read_archive_members(package : Package, archive_path : Path, paths : Set[str]) -> Dict[str, bytes]:
+    contents = dict()
+    if package.local.suffix=='.zip':
+        with zipfile.ZipFile(archive_path, mode='r') as archive:
+            names = archive.namelist()
+            top_level = names[0].split('/')[0]
+            prefix = f'{top_level}/' if all(name.startswith(f'{top_level}/') for name in names) else ''
+            for path in paths:
+                if f'{prefix}{path}' in names:
+                    contents[path] = archive.read(f'{prefix}{path}')
+    else:
+        with tarfile.open(archive_path, mode='r:gz') as archive:
+            prefix = None
+            for member in archive:
+                if prefix is None:
+                    prefix = f'{member.name}/' if member.isdir() else ''
+                name = member.name[len(prefix):]
+                if member.isfile() and member.name.startswith(prefix) and name in paths:
+                    contents[name] = archive.extractfile(member).read()
+    return contents
+
+def verify_from_archive(package : Package, archive_path : Path) -> None:
+    paths = {fp.path for patch_file in package.patches for fp in parse_patch(patch_file)}
+    contents = read_archive_members(package, archive_path, paths)
+    verify_package_patches(package, contents.get)
+
+def verify_patches(packages : List[Package]) -> None:
+    checks = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.cpus)) as verifier:
+        for p in packages:
+            archive_path = cached_archive(p) if p.patches else None
+            if archive_path:
+                checks[p.name] = verifier.submit(verify_from_archive, p, archive_path)
+    failed = [(name, future.exception()) for name, future in checks.items() if future.exception() is not None]
+    for name, exception in failed:
+        print(f"Patches of {name} do not apply: {exception}")
+    if len(failed)>0:
+        raise Exception(f"Patches of {len(failed)} packages do not apply.")
+    if len(checks)>0:
+        print(f"Patches of {', '.join(checks)} verified.")
+
+def fetch_package(package : Package) -> None:
+    package.acquire_it()
+    if package.patches:
+        verify_package_patches(package, tree_reader(Path(package.extract_location)))
+
+@register_package
+def boost():
+    boost_version = '1.77.0'
+    boost_version_ = boost_version.replace('.', '_')
+    boost_url = f'https://boostorg.jfrog.io/artifactory/main/release/{boost_version}/source/boost_{boost_version_}.zip'
+    def boost_include_dir(self) -> str:
+        boost_inc = self.extract_location / '..' / 'boost_install' / 'include'
+        boost_inc = boost_inc.resolve()
+        return f"{boost_inc}"
+
+    def boost_library_dir(self) -> str:
+        boost_lib = (self.extract_location / '..' / 'boost_install' / 'lib').resolve()
+        return f"{boost_lib}"
+
+    def boost_package(self) -> None:
+        bundle_package(self)
+
+    boost_libraries = ['date_time', 'chrono', 'filesystem', 'locale', 'regex', 'system', 'thread', 'serialization']
+    boost_support_libraries = ['config', 'predef', 'headers', 'atomic']
+    boost_extract_rules = [
+        '+ libs/config/test/*',
+        *[f'- libs/*/{folder}/*' for folder in ['doc', 'test', 'example', 'examples', 'bench', 'perf']],
+        '+ boost/*',
+        '+ tools/build/*',
+        '+ tools/boost_install/*',
+        *[f'+ libs/{library}/*' for library in boost_libraries + boost_support_libraries],
+        '- */*'
+    ]
+
+    def resolve_boost_trim(value : str) -> str:
+        if value not in ['on', 'off']:
+            raise Exception(f"Unknown Boost trim setting {value}, use on or off.")
+        boost_dep.extract_rules = boost_extract_rules if value=='on' else []
+        return value
+
+    def boost_build(self) -> None:
+        boost_install = self.extract_location / '..' / 'boost_install'
+        if boost_install.exists():
+            folder_recursive_delete(boost_install)
+        boost_install.mkdir()
+    
+        if on_windows:
+            bootstrap = [f"{self.extract_location / 'bootstrap.bat' }"]
+            b2exe = f"{self.extract_location / 'b2.exe' }"
+            toolsets = ['14.1', '14.2']
+        else:
+            bootstrap = [f"{self.extract_location / 'bootstrap.sh' }"]
+            buildsh = f"{self.extract_location / 'tools/build/src/engine/build.sh' }"
+            b2exe = f"{self.extract_location / 'b2' }"
+            chmod_process = subprocess.run(['chmod', 'u+x', bootstrap[0], buildsh])
+            if chmod_process.returncode!=0:
+                print("Could not change bootstrap.sh permissions.")
+                raise Exception("Problem setting bootstrap.sh permissions.")
+            toolsets = ['clang'] if on_macos else ['gcc']
+    
+        print("Bootstrapping Boost... ")
+        with timed(self.name, 'configure'):
+            bootstrap_process = run_logged(self.name, 'bootstrap', bootstrap, cwd=self.extract_location)
+        if bootstrap_process.returncode!=0:
+            print("Problem bootstrapping Boost:")
+            bootstrap_process.print_tail()
+            raise Exception("Problem bootstrapping Boost.")
+        print("Bootstrapping Boost complete.")
+    
+    
+        boost_build = self.extract_location / '..' / 'boost_build'
+        if boost_build.exists():
+            folder_recursive_delete(boost_build)
+        boost_build.mkdir()
+    
+        for toolset in toolsets:
+            targets = ["install"] if toolset==toolsets[0] else [f"--stagedir={boost_install}", "stage"]
+            boostbuild= [
+                b2exe,
+                "-d+2",
+                "-q",
+                f"--prefix={boost_install}",
+                "--no-cmake-config",
+                "--build-type=minimal",
+                f"--build-dir={boost_build}",
+                "--layout=tagged",
+                f"--buildid=RH-v{toolset.replace('.', '')}" if on_windows else f"--buildid=RH-{toolset.replace('.', '')}",
+                "variant=release,debug",
+                "warnings=off",
+                f"toolset=msvc-{toolset}" if on_windows else f"toolset={toolset}",
+                "link=shared",
+                "threading=multi",
+                "runtime-link=shared",
+                "address-model=64",
+                *[f"--with-{library}" for library in boost_libraries],
+                *targets
+            ]
+    
+            print(f"Building Boost: {toolset}... ")
+            with timed(self.name, 'build'):
+                boostbuild_process = run_logged(self.name, f'build-{toolset}', boostbuild, cwd=self.extract_location, jobs=make_jobs)
+            if boostbuild_process.returncode!=0:
+                print(f"Problem building Boost, {toolset}:")
+                boostbuild_process.print_tail()
+                raise Exception(f"Problem building Boost. {toolset}")
+            print(f"Building Boost complete. {toolset}")
+
+    boost_local = dl_folder / f'boost_{boost_version_}.zip'
+
+    boost_dep = Package("Boost", boost_version, boost_url, boost_local,
+                            download_and_extract_package,
+                            boost_include_dir, boost_library_dir, no_patches, [],
+                            boost_build, boost_package,
+                            [], '', 'boost_install',
+                            [], {'trim': PackageOption('off', resolve_boost_trim)})
+    return boost_dep
+
+def openexr_include_dir(self) -> str:
+    install_dir = (self.extract_location / '..' / 'openexr_install' / 'include').resolve()
+    return f"{install_dir}"
+
+def openexr_library_dir(self) -> str:
+    return ""
+
+def openexr_package(self) -> None:
+    bundle_package(self)
+
+def openexr_build(self) -> None:
+    # we shouldn't build in the source directory (extract_location)
+    build_dir = Path(self.extract_location) / '..' / 'openexr_build'
+    install_dir = Path(self.extract_location) / '..' / 'openexr_install'
+
+    if build_dir.exists():
+        folder_recursive_delete(build_dir)
+    build_dir.mkdir()
+
+    if install_dir.exists():
+        folder_recursive_delete(install_dir)
+    install_dir.mkdir()
+
+    zlib = self.dependency('zlib')
+    zlib_library = zlib.library
+    zlib_include_dir = zlib.include_dir
+
+    openexr_config_cmake = [
+        'cmake',
+        *compiler_cache_cmake_args(),
+        *cmake_platform_args(),
+        f'-DCMAKE_SYSTEM_PREFIX={install_dir}',
+        f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+        '-DOPENEXR_LIB_SUFFIX=-RH-2_5',
+        '-DILMBASE_LIB_SUFFIX=-RH-2_5',
+        f'-DZLIB_LIBRARY={zlib_library}',
+        f'-DZLIB_INCLUDE_DIR={zlib_include_dir}',
+        '-DPYILMBASE_ENABLE=OFF',
+        f"{self.extract_location}"
+    ]
+
+    print("Configuring OpenEXR")
+    with timed(self.name, 'configure'):
+        openexr_config_process = run_logged(self.name, 'configure', openexr_config_cmake, cwd=build_dir)
+    if openexr_config_process.returncode!=0:
+        openexr_config_process.print_tail()
+        raise Exception("OpenEXR configuration failed")
+
+    print("OpenEXR configured.")
+
+    for config in cmake_configs():
+        openexr_build_cmake = [
+            'cmake',
+            '--build',
+            '.',
+            '--target',
+            'install',
+            '--config',
+            config
+        ]
+        print("Building OpenEXR")
+        with timed(self.name, 'build'):
+            openexr_build_process = run_logged(self.name, f'build-{config.lower()}', openexr_build_cmake, cwd=build_dir, jobs=cmake_jobs)
+        if openexr_build_process.returncode!=0:
+            openexr_build_process.print_tail()
+            raise Exception("OpenEXR build failed")
+
+    print("OpenEXR built.")
+@register_package
+def openexr():
+    openexr_version = '2.5.5'
+    openexr_url = f'https://github.com/AcademySoftwareFoundation/openexr/archive/refs/tags/v{openexr_version}.zip'
+    openexr_local = dl_folder / f'openexr_{openexr_version}.zip'
+    openexr_dep = Package("OpenEXR", openexr_version, openexr_url, openexr_local,
+                            download_and_extract_package,
+                            openexr_include_dir, openexr_library_dir, no_patches, [],
+                            openexr_build, openexr_package,
+                            ['zlib'], '', 'openexr_install', [], {})
+    return openexr_dep
+
+def oiio_include_dir(self) -> str:
+    return f"{self.extract_location}"
+
+def oiio_library_dir(self) -> str:
+    return f"{self.extract_location}"
+
+def oiio_package(self) -> None:
+    bundle_package(self)
+
+def oiio_build(self) -> None:
+    build_dir = self.extract_location / '..' / 'oiio_build'
+    install_dir = self.extract_location / '..' / 'oiio_install'
+
+    if build_dir.exists():
+        folder_recursive_delete(build_dir)
+    build_dir.mkdir()
+
+    if install_dir.exists():
+        folder_recursive_delete(install_dir)
+    install_dir.mkdir()
+
+    zlib_library = self.dependency('zlib').library
+    zlib_root = self.dependency('zlib').root
+    libtiff_root = self.dependency('libtiff').root
+    openexr_root = self.dependency('openexr').root
+    libjpeg_include = self.dependency('libjpeg').include_dir
+    libjpeg_root = self.dependency('libjpeg').root
+    boost = self.dependency('boost')
+    boost_library_dir = boost.library
+    boost_include_dir = boost.include_dir
+    boost_root = boost.root
+    if on_macos:
+        prefix = 'lib'
+        postfix = 'clang.dylib'
+    elif on_linux:
+        prefix = 'lib'
+        postfix = 'gcc.so'
+    else:
+        prefix = ''
+        postfix = 'v141.lib'
+    
+    _boost_libraries = [
+        'boost_atomic-mt-x64-RH-',
+        'boost_chrono-mt-x64-RH-',
+        'boost_date_time-mt-x64-RH-',
+        'boost_filesystem-mt-x64-RH-',
+        'boost_locale-mt-x64-RH-',
+        'boost_regex-mt-x64-RH-',
+        'boost_serialization-mt-x64-RH-',
+        'boost_system-mt-x64-RH-',
+        'boost_thread-mt-x64-RH-',
+        'boost_wserialization-mt-x64-RH-'
+    ]
+    boost_libraries = ';'.join([f'{prefix}{lib}{postfix}' for lib in _boost_libraries])
+    oiio_config_cmake = [
+        'cmake',
+        *compiler_cache_cmake_args(),
+        *cmake_platform_args(),
+        '-DCMAKE_VERBOSE_MAKEFILE=ON',
+        f'-DCMAKE_SYSTEM_PREFIX={install_dir}',
+        f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+        '-DUSE_PTHREAD=OFF',
+        '-DUSE_PYTHON=OFF',
+        '-DUSE_CCACHE=OFF',
+        '-DOIIO_BUILD_TOOLS=OFF',
+        '-DOIIO_BUILD_TESTS=OFF',
+        '-DBUILD_TESTING=OFF',
+        '-DBUILD_DOCS=OFF',
+        '-DBUILD_FMT_FORCE=OFF',
+        '-DBUILD_MISSING_DEPS=OFF',
+        '-DINSTALL_DOCS=OFF',
+        '-DINSTALL_FONTS=OFF',
+        '-DOIIO_THREAD_ALLOW_DCLP=OFF',
+        '-DENABLE_GIF=OFF',
+        '-DENABLE_BZIP2=OFF',
+        '-DENABLE_FREETYPE=OFF',
+        '-DENABLE_HDF5=OFF',
+        '-DENABLE_LIBHEIF=OFF',
+        '-DENABLE_LibRaw=OFF',
+        '-DENABLE_OPENGL=OFF',
+        '-DENABLE_OPENGL_gl=OFF',
+        '-DENABLE_OPENGL_glu=OFF',
+        '-DENABLE_OPENJPEG=OFF',
+        '-DENABLE_OpenCV=OFF',
+        '-DENABLE_Ptex=OFF',
+        '-DENABLE_Qt5=OFF',
+        '-DENABLE_LBSQUISH=OFF',
+        '-DENABLE_NUKE_DOIMAGE=OFF',
+        '-DENABLE_WEBP=OFF',
+        '-DOIIO_LIBNAME_SUFFIX=RH',
+        '-DLINKSTATIC=ON',
+        f'-DZLIB_ROOT={zlib_root}',
+        f'-DZLIB_LIBRARY_DEBUG={zlib_library}',
+        f'-DZLIB_LIBRARY_RELEASE={zlib_library}',
+        f'-DBoost_ROOT={boost_root}',
+        '-DBOOST_CUSTOM=ON',
+        '-DBoost_VERSION=1.77',
+        f'-DBoost_INCLUDE_DIRS={boost_include_dir}',
+        f'-DBoost_LIBRARY_DIRS={boost_library_dir}',
+        f'-DBoost_LIBRARIES={boost_libraries}',
+        f'-DOpenEXR_ROOT={openexr_root}',
+        f'-DTIFF_ROOT={libtiff_root}',
+        f'-DJPEG_INCLUDE_DIR={libjpeg_include}',
+        f'-DJPEG_ROOT={libjpeg_root}',
+        f"{self.extract_location}"
+    ]
+    
+    print(oiio_config_cmake)
+    
+    with timed(self.name, 'configure'):
+        oiio_config_process = run_logged(self.name, 'configure', oiio_config_cmake, cwd=build_dir)
+    if oiio_config_process.returncode!=0:
+        oiio_config_process.print_tail()
+        raise Exception("OpenImageIO configuration failed")
+    else:
+        print("OpenImageIO configured.")
+
+    for config in cmake_configs():
+        oiio_build_cmake = [
+            'cmake',
+            '--build',
+            '.',
+            '--target',
+            'install',
+            '--config',
+            config
+        ]
+        with timed(self.name, 'build'):
+            oiio_build_process = run_logged(self.name, f'build-{config.lower()}', oiio_build_cmake, cwd=build_dir, jobs=cmake_jobs)
+        if oiio_build_process.returncode!=0:
+            oiio_build_process.print_tail()
+            raise Exception("OpenImageIO build failed")
+    print("OpenImageIO built")
+
+@register_package
+def oiio():
+    oiio_version = '2.2.19.0'
+    oiio_url = f'https://github.com/OpenImageIO/oiio/archive/refs/tags/v{oiio_version}.zip'
+    oiio_local = dl_folder / f'OpenImageIOv{oiio_version}.zip'
+    oiio_dep = Package("OpenImageIO", oiio_version, oiio_url, oiio_local,
+                            download_and_extract_package,
+                            oiio_include_dir, oiio_library_dir, no_patches, [],
+                            oiio_build, oiio_package,
+                            ["zlib", "openexr", "boost", "libpng", "libtiff", "libjpeg"], '', 'oiio_install', [], {})
+    return oiio_dep
+
+def zlib_include_dir(self) -> str:
+    return f"{self.extract_location}"
+
+def zlib_library_dir(self) -> str:
+    if not on_windows:
+        return f"{Path(self.extract_location) / 'libz.a'}"
+    else:
+        return f"{Path(self.extract_location) / 'contrib' / 'vstudio' / 'vc14' / 'x64' / 'ZlibStatRelease' / 'zlibstat.lib'}"
+
+def zlib_package(self) -> None:
+    bundle_package(self)
+
+def zlib_build_windows(self) -> None:
+    asmcode = self.extract_location / 'contrib' / 'masmx64' / 'bld_ml64.bat'
+    asmcode_wd = asmcode.parent
+    sln = self.extract_location / 'contrib' / 'vstudio' / 'vc14' / 'zlibvc.sln'
+
+    build_settings = [f"{msbuild}",
+                    f"{sln}",
+                    "/t:zlibstat",
+                    "/p:Configuration=Release",
+                    "/p:Platform=x64"
+    ]
+
+    print(build_settings)
+
+    with timed(self.name, 'configure'):
+        asm_process = run_logged(self.name, 'asm', [f"{asmcode}"], cwd=asmcode_wd)
+    if asm_process.returncode!=0:
+        print("Assembling zlib failed")
+        asm_process.print_tail()
+        raise Exception("Assembling zlib failed")
+
+    with timed(self.name, 'build'):
+        build_process = run_logged(self.name, 'build', build_settings, jobs=msbuild_jobs)
+    if build_process.returncode!=0:
+        print("Building zlib failed")
+        build_process.print_tail()
+        raise Exception("Building zlib failed")
+
+
+    print(f"Use {sln}, {sln.exists()}")
+
+
+def zlib_build_macos(self) -> None:
+    configure = self.extract_location / 'configure'
+
+    build_settings = [f"{configure}",
+                    "--static",
+                    "--64"
+    ]
+
+    print(build_settings)
+
+    chmod_process = subprocess.run(['chmod', 'u+x', configure], cwd=f"{self.extract_location}", encoding='utf-8', universal_newlines='\n', capture_output=True)
+
+    with timed(self.name, 'configure'):
+        configure_process = run_logged(self.name, 'configure', build_settings, cwd=self.extract_location, env={'CFLAGS': '-O3 -fPIC'} if on_linux else None)
+    if configure_process.returncode!=0:
+        print("Configuring zlib failed")
+        configure_process.print_tail()
+        raise Exception("Configuring zlib failed")
+
+    with timed(self.name, 'build'):
+        make_process = run_logged(self.name, 'build', ['make'], cwd=self.extract_location, jobs=make_jobs)
+    if make_process.returncode!=0:
+        print("Building zlib failed")
+        make_process.print_tail()
+        raise Exception("Building zlib failed")
+
+
+def zlib_build(self) -> None:
+    print("="*20)
+    print(f"\nBuilding {self.name}")
+    print(f"For {self.name} extract location: {self.extract_location}")
+
+    if on_windows:
+        zlib_build_windows(self)
+    else:
+        zlib_build_macos(self)
+
+@register_package
+def zlib():
+    zlib_version = '1.2.11'
+    zlib_version_n = zlib_version.replace('.', '')
+    zlib_url = f'https://www.zlib.net/zlib{zlib_version_n}.zip'
+    zlib_local = dl_folder / f'zlib_{zlib_version}.zip'
+    zlib_dep = Package("zlib", zlib_version, zlib_url, zlib_local,
+                            download_and_extract_package,
+                            zlib_include_dir, zlib_library_dir, apply_patches,
+                            [patches_folder / 'zlib_build_system.patch'] if on_windows else [],
+                            zlib_build, zlib_package,
+                            [], '', '', [], {})
+    return zlib_dep
+
+def libpng_include_dir(self) -> str:
+    return ""
+
+def libpng_library_dir(self) -> str:
+    return ""
+
+def libpng_package(self) -> None:
+    bundle_package(self)
+
+def libpng_macos_build(self) -> None:
+    print("="*20)
+    print(f"\nBuilding {self.name}")
+    print(f"For {self.name} extract location: {self.extract_location}")
+    build_dir = self.extract_location / '..' / 'libpng_build'
+    install_dir = self.extract_location / '..' / 'libpng_install'
+
+    """dos2unix = [
+        "find",
+        ".",
+        "-type",
+        "f",
+        "|",
+        "xargs",
+        "dos2unix"
+    ]
+
+    dos2unix_process = subprocess.run(dos2unix, cwd=f"{self.extract_location}", encoding='utf-8', universal_newlines='\n', capture_output=True)
+
+    print(dos2unix_process.stdout)"""
+
+    if build_dir.exists():
+        folder_recursive_delete(build_dir)
+    build_dir.mkdir()
+
+    if install_dir.exists():
+        folder_recursive_delete(install_dir)
+    install_dir.mkdir()
+
+    libpng_config_cmake = [
+        'cmake',
+        *compiler_cache_cmake_args(),
+        *cmake_platform_args(),
+        '-DPNG_TESTS=OFF',
+        '-DPNG_SHARED=OFF',
+        *(['-DAWK=/usr/local/bin/gawk'] if on_macos else []),
+        f'-DCMAKE_SYSTEM_PREFIX={install_dir}',
+        f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+        f'{self.extract_location}'
+    ]
+
+    with timed(self.name, 'configure'):
+        libpng_config_process = run_logged(self.name, 'configure', libpng_config_cmake, cwd=build_dir)
+    if libpng_config_process.returncode!=0:
+        print("Configuring libPNG failed")
+        libpng_config_process.print_tail()
+        raise Exception("Configuring libPNG failed")
+    else:
+        print("libPNG configured")
+
+
+    for config in cmake_configs():
+        with timed(self.name, 'build'):
+            make_process = run_logged(self.name, f'build-{config.lower()}', ['cmake', '--build', '.', '--target', 'install', '--config', config], cwd=build_dir, jobs=cmake_jobs)
+
+        if make_process.returncode!=0:
+            print("Building libPNG failed")
+            make_process.print_tail()
+            raise Exception("Building libPNG failed")
+
+def libpng_windows_build(self) -> None:
+    print("="*20)
+    print(f"\nBuilding {self.name}")
+    print(f"For {self.name} extract location: {self.extract_location}")
+
+    sln = self.extract_location / 'projects' / 'vstudio' / 'vstudio.sln'
+
+    build_settings = [f"{msbuild}",
+                      f"{sln}",
+                      "/t:libpng",
+                      "/p:Configuration=Release Library",
+                      "/p:Platform=x64"
+    ]
+
+    with timed(self.name, 'build'):
+        build_process = run_logged(self.name, 'build', build_settings, jobs=msbuild_jobs)
+    if build_process.returncode!=0:
+        print("Building libPNG failed")
+        build_process.print_tail()
+        raise Exception("Building libPNG failed")
+
+def libpng_build(self) -> None:
+    print("="*20)
+    print(f"\nBuilding {self.name}")
+    print(f"For {self.name} extract location: {self.extract_location}")
+
+    if on_windows:
+        libpng_windows_build(self)
+    else:
+        libpng_macos_build(self)
+
+
+@register_package
+def libpng():
+    libpng_version = '1.6.37'
+    libpng_version_n = libpng_version.replace('.', '')
+    #libpng_url = f'https://downloads.sourceforge.net/project/libpng/libpng16/1.6.37/lpng1637.zip?ts=gAAAAABhcdxHiIQEppu8-oHTz9BTr3p2tJM_DeS4-wTGyGlS-kXzOZEPyiS_chMS85CqLLmKuoeYL0KiRykk2btl3edJf2E_tw%3D%3D&r=https%3A%2F%2Fsourceforge.net%2Fprojects%2Flibpng%2Ffiles%2Flibpng16%2F1.6.37%2Flpng1637.zip%2Fdownload%3Fuse_mirror%3Daltushost-swe'
+    
+    libpng_url = 'https://downloads.sourceforge.net/project/libpng/libpng16/1.6.37/libpng-1.6.37.tar.gz?ts=gAAAAABhvF0oil3-kb0cblcm84Gl5XI3czxVE87TaeARn56PerrRwPViMRERvr8KKWSi88uy4gmoj9J6ZolV4oQw8CQSDfIf5Q%3D%3D&r=https%3A%2F%2Fsourceforge.net%2Fprojects%2Flibpng%2Ffiles%2Flibpng16%2F1.6.37%2Flibpng-1.6.37.tar.gz%2Fdownload'
+    libpng_local = dl_folder / f'libpng_{libpng_version_n}.tar.gz'
+    libpng_dep = Package("libpng", libpng_version, libpng_url, libpng_local,
+                            download_and_extract_package,
+                            libpng_include_dir, libpng_library_dir, apply_patches,
+                            [patches_folder / 'lpng_build_system.patch'],
+                            libpng_build, libpng_package,
+                            ['zlib'], '', '' if on_windows else 'libpng_install', [], {})
+    return libpng_dep
+
+def embree_include_dir(self) -> str:
+    return ""
+
+def embree_library_dir(self) -> str:
+    return ""
+
+def embree_package(self) -> None:
+    bundle_package(self)
+
+embree_isas = ['sse2', 'sse4.2', 'avx', 'avx2', 'avx512']
+
+def resolve_embree_isa(value : str) -> str:
+    if value=='host':
+        return host_embree_isa()
+    if value=='all':
+        return value
+    isas = [isa.strip().lower() for isa in value.split(',')]
+    unknown = [isa for isa in isas if isa not in embree_isas]
+    if unknown:
+        raise Exception(f"Unknown embree ISA {', '.join(unknown)}, use host, all or a list of {', '.join(embree_isas)}.")
+    return ','.join(isa for isa in embree_isas if isa in isas)
+
+def embree_isa_cmake_args(isa : str) -> List[str]:
+    if isa=='all':
+        return []
+    enabled = isa.split(',')
+    return ['-DEMBREE_MAX_ISA=NONE',
+            *[f"-DEMBREE_ISA_{name.replace('.', '').upper()}={'ON' if name in enabled else 'OFF'}" for name in embree_isas]]
+
+def host_embree_isa() -> str:
+    if platform.machine().lower() not in ['x86_64', 'amd64', 'i386', 'i686', 'x86']:
+        return 'all'
+    if on_windows:
+        features = {'sse2': 10, 'sse4.2': 38, 'avx': 39, 'avx2': 40, 'avx512': 41}
+        supported = [isa for isa, feature in features.items() if ctypes.windll.kernel32.IsProcessorFeaturePresent(feature)]
+    else:
+        if on_macos:
+            sysctl = subprocess.run(['sysctl', '-n', 'machdep.cpu.features', 'machdep.cpu.leaf7_features'],
+                                    capture_output=True, encoding='utf-8')
+            flags = set(sysctl.stdout.lower().split())
+            required = {'sse2': ['sse2'], 'sse4.2': ['sse4.2'], 'avx': ['avx1.0'], 'avx2': ['avx2']}
+        else:
+            cpuinfo = Path('/proc/cpuinfo').read_text()
+            flags = set(next((line.split(':', 1)[1] for line in cpuinfo.splitlines() if line.startswith('flags')), '').split())
+            required = {'sse2': ['sse2'], 'sse4.2': ['sse4_2'], 'avx': ['avx'], 'avx2': ['avx2']}
+        required['avx512'] = ['avx512f', 'avx512cd', 'avx512dq', 'avx512bw', 'avx512vl']
+        supported = [isa for isa, needed in required.items() if all(flag in flags for flag in needed)]
+    return supported[-1] if supported else 'sse2'
+
+def embree_build(self) -> None:
+    print(self.extract_location)
+    # we shouldn't build in the source directory (extract_location)
+    build_dir = (self.extract_location / '..' / 'embree_build').resolve()
+    install_dir = (self.extract_location / '..' / 'embree_install').resolve()
+    if build_dir.exists():
+        folder_recursive_delete(build_dir)
+    build_dir.mkdir()
+
+    if install_dir.exists():
+        folder_recursive_delete(install_dir)
+    install_dir.mkdir()
+
+    tasking_system = 'PPL' if on_windows else 'INTERNAL'
+
+    embree_config_cmake = [
+        'cmake',
+        *compiler_cache_cmake_args(),
+        *cmake_platform_args(),
+        f'-DCMAKE_SYSTEM_PREFIX={install_dir}',
+        f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+        '-DEMBREE_LIBRARY_NAME=embree3_RH',
+        f'-DEMBREE_TASKING_SYSTEM={tasking_system}', # tbb (thread building blocks), ppl (parallel patterns library, windows only), internal
+        '-DEMBREE_ISPC_SUPPORT=OFF',
+        '-DEMBREE_TUTORIALS=OFF',
+        *embree_isa_cmake_args(self.options['isa'].value),
+        #'-dopenexr_lib_suffix=-rh-2_5',
+        #'-dilmbase_lib_suffix=-rh-2_5',
+        f"{self.extract_location}"
+    ]
+
+    with timed(self.name, 'configure'):
+        embree_config_process = run_logged(self.name, 'configure', embree_config_cmake, cwd=build_dir)
+    if embree_config_process.returncode!=0:
+        embree_config_process.print_tail()
+        raise Exception("embree configuration failed")
+
+    for config in cmake_configs():
+        embree_build_cmake = [
+            'cmake',
+            '--build',
+            '.',
+            '--target',
+            'install',
+            '--config',
+            config
+        ]
+        with timed(self.name, 'build'):
+            embree_build_process = run_logged(self.name, f'build-{config.lower()}', embree_build_cmake, cwd=build_dir, jobs=cmake_jobs)
+        if embree_build_process.returncode!=0:
+            embree_build_process.print_tail()
+            raise Exception("embree build failed")
+
+@register_package
+def embree():
+    embree_version = '3.13.2'
+    embree_url = f'https://github.com/embree/embree/archive/refs/tags/v{embree_version}.zip'
+    embree_local = dl_folder / f'embree_{embree_version}.zip'
+    embree_dep = Package("embree", embree_version, embree_url, embree_local,
+                            download_and_extract_package,
+                            embree_include_dir, embree_library_dir, no_patches, [],
+                            embree_build, embree_package,
+                            [], '', 'embree_install', [],
+                            {'isa': PackageOption('all', resolve_embree_isa)})
+    return embree_dep
+
+def libtiff_include_dir(self) -> str:
+    install_dir = (Path(self.extract_location) / '..' / 'libtiff_install' / 'include').resolve()
+    return f"{install_dir}"
+
+def libtiff_library_dir(self) -> str:
+    if not on_windows:
+        lib = Path(self.extract_location) / '..' / 'libtiff_install' / 'lib' / 'libtiff.a'
+    else:
+        lib = Path(self.extract_location) / '..' / 'libtiff_install' / 'lib' / 'tiff.lib'
+    lib = lib.resolve()
+    return f"{lib}"
+
+def libtiff_package(self) -> None:
+    bundle_package(self)
+
+def libtiff_build(self) -> None:
+    print(self.extract_location)
+    # we shouldn't build in the source directory (extract_location)
+    build_dir = Path(self.extract_location) / '..' / 'libtiff_build'
+    install_dir = Path(self.extract_location) / '..' / 'libtiff_install'
+
+    if build_dir.exists():
+        folder_recursive_delete(build_dir)
+    build_dir.mkdir()
+
+    if install_dir.exists():
+        folder_recursive_delete(install_dir)
+    install_dir.mkdir()
+
+    zlib = self.dependency('zlib')
+    zlib_library = zlib.library
+    zlib_include_dir = zlib.include_dir
+    libjpeg = self.dependency('libjpeg')
+    jpeg_library = libjpeg.library
+    jpeg_include_dir = libjpeg.include_dir
+
+    libtiff_config_cmake = [
+        'cmake',
+        *compiler_cache_cmake_args(),
+        *cmake_platform_args(),
+        f'-DCMAKE_SYSTEM_PREFIX={install_dir}',
+        f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+        '-DBUILD_SHARED_LIBS=OFF',
+        f'-DZLIB_LIBRARY={zlib_library}',
+        f'-DZLIB_INCLUDE_DIR={zlib_include_dir}',
+        f'-DJPEG_LIBRARY={jpeg_library}',
+        f'-DJPEG_INCLUDE_DIR={jpeg_include_dir}',
+        '-Dlerc=OFF',
+        '-Dlibdeflate=OFF',
+        '-Djbig=OFF',
+        '-Djpeg12=OFF',
+        '-Dwebp=OFF',
+        '-Dzstd=OFF',
+        '-DENABLE_WebP=OFF',
+        '-DENABLE_WEBP=OFF',
+        '-DENABLE_ZSTD=OFF',
+        '-DENABLE_JPEG12=OFF',
+        '-DENABLE_JBIG=OFF',
+        f"{self.extract_location}"
+    ]
+
+    with timed(self.name, 'configure'):
+        libtiff_config_process = run_logged(self.name, 'configure', libtiff_config_cmake, cwd=build_dir)
+    if libtiff_config_process.returncode!=0:
+        libtiff_config_process.print_tail()
+        raise Exception("libtiff configuration failed")
+
+    for config in cmake_configs():
+        libtiff_build_cmake = [
+            'cmake',
+            '--build',
+            '.',
+            '--target',
+            'install',
+            '--config',
+            config
+        ]
+        with timed(self.name, 'build'):
+            libtiff_build_process = run_logged(self.name, f'build-{config.lower()}', libtiff_build_cmake, cwd=build_dir, jobs=cmake_jobs)
+        if libtiff_build_process.returncode!=0:
+            libtiff_build_process.print_tail()
+            raise Exception("libtiff build failed")
+
+@register_package
+def libtiff():
+    libtiff_version = '4.3.0'
+    libtiff_url = f'https://gitlab.com/libtiff/libtiff/-/archive/v{libtiff_version}/libtiff-v{libtiff_version}.zip'
+    libtiff_local = dl_folder / f'libtiff_{libtiff_version}.zip'
+    libtiff_dep = Package("libtiff", libtiff_version, libtiff_url, libtiff_local,
+                            download_and_extract_package,
+                            libtiff_include_dir, libtiff_library_dir, apply_patches,
+                            [patches_folder / 'libtiff_build_system.patch'],
+                            libtiff_build, libtiff_package,
+                            ['zlib', 'libjpeg'], '', 'libtiff_install', [], {})
+    return libtiff_dep
+
+def libjpeg_include_dir(self) -> str:
+    install_dir = (Path(self.extract_location) / '..' / 'libjpeg_install' / 'include').resolve()
+    return f"{install_dir}"
+
+def libjpeg_library_dir(self) -> str:
+    if not on_windows:
+        lib = Path(self.extract_location) / '..' / 'libjpeg_install' / 'lib' / 'libjpeg.a'
+    else:
+        lib = Path(self.extract_location) / '..' / 'libjpeg_install' / 'lib' / 'jpeg.lib'
+    lib = lib.resolve()
+    return f"{lib}"
+
+def libjpeg_package(self) -> None:
+    bundle_package(self)
+
+def libjpeg_build(self) -> None:
+    print(self.extract_location)
+    # we shouldn't build in the source directory (extract_location)
+    build_dir = Path(self.extract_location) / '..' / 'libjpeg_build'
+    install_dir = Path(self.extract_location) / '..' / 'libjpeg_install'
+
+    if build_dir.exists():
+        folder_recursive_delete(build_dir)
+    build_dir.mkdir()
+
+    if install_dir.exists():
+        folder_recursive_delete(install_dir)
+    install_dir.mkdir()
+
+    libjpeg_config_cmake = [
+        'cmake',
+        *compiler_cache_cmake_args(),
+        *cmake_platform_args(),
+        f'-DCMAKE_SYSTEM_PREFIX={install_dir}',
+        f'-DCMAKE_INSTALL_PREFIX={install_dir}',
+        f"{self.extract_location}"
+    ]
+
+    with timed(self.name, 'configure'):
+        libjpeg_config_process = run_logged(self.name, 'configure', libjpeg_config_cmake, cwd=build_dir)
+    if libjpeg_config_process.returncode!=0:
+        libjpeg_config_process.print_tail()
+        raise Exception("libjpeg configuration failed")
+
+    for config in cmake_configs():
+        libjpeg_build_cmake = [
+            'cmake',
+            '--build',
+            '.',
+            '--target',
+            'install',
+            '--config',
+            config
+        ]
+        with timed(self.name, 'build'):
+            libjpeg_build_process = run_logged(self.name, f'build-{config.lower()}', libjpeg_build_cmake, cwd=build_dir, jobs=cmake_jobs)
+        if libjpeg_build_process.returncode!=0:
+            libjpeg_build_process.print_tail()
+            raise Exception("libjpeg build failed")
+
+@register_package
+def libjpeg():
+    libjpeg_version = '2.1.1'
+    libjpeg_url = f'https://github.com/libjpeg-turbo/libjpeg-turbo/archive/refs/tags/{libjpeg_version}.zip'
+    libjpeg_local = dl_folder / f'libjpeg_{libjpeg_version}.zip'
+    libjpeg_dep = Package("libjpeg", libjpeg_version, libjpeg_url, libjpeg_local,
+                            download_and_extract_package,
+                            libjpeg_include_dir, libjpeg_library_dir, no_patches, [],
+                            libjpeg_build, libjpeg_package,
+                            [], '', 'libjpeg_install', [], {})
+    return libjpeg_dep
+
+def function_sources(func : Callable, seen : Set[str]) -> List[str]:
+    if not inspect.isfunction(func) or func.__qualname__ in seen:
+        return []
+    seen.add(func.__qualname__)
+    sources = [inspect.getsource(func)]
+    for name in func.__code__.co_names:
+        called = func.__globals__.get(name)
+        if inspect.isfunction(called) and called.__module__ == func.__module__:
+            sources.extend(function_sources(called, seen))
+    return sources
+
+def sources_hash(sources : List[str]) -> str:
+    return hashlib.sha256(''.join(sources).encode('utf-8')).hexdigest()
+
+def package_inputs(package : Package, dependency_keys : Dict[str, str]) -> Dict[str, str]:
+    inputs = {
+        'platform': platform.system(),
+        'name': package.name,
+        'version': package.version,
+        'url': package.url,
+        'install_folder': package.install_folder
+    }
+    for patch in package.patches:
+        inputs[f'patch {patch.name}'] = hashlib.sha256(patch.read_bytes()).hexdigest()
+    if package.extract_rules:
+        inputs['extract_rules'] = hashlib.sha256(json.dumps(package.extract_rules).encode('utf-8')).hexdigest()
+    for name, option in package.options.items():
+        inputs[f'option {name}'] = option.value
+    seen = set()
+    inputs['patcher'] = sources_hash(function_sources(package.patcher, seen))
+    inputs['builder'] = sources_hash(function_sources(package.builder, seen))
+    if 'cmake_configs' in seen:
+        inputs['configs'] = ','.join(cmake_configs())
+    for dependency, dependency_key in dependency_keys.items():
+        inputs[f'dependency {dependency}'] = dependency_key
+    return inputs
+
+def package_cache_key(inputs : Dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+def compute_cache_keys(packages : List[Package]) -> Tuple[Dict[str, str], Dict[str, Dict[str, str]]]:
+    keys = dict()
+    all_inputs = dict()
+    for p in packages:
+        inputs = package_inputs(p, {d: keys[d.lower()] for d in p.dependencies})
+        all_inputs[p.name.lower()] = inputs
+        keys[p.name.lower()] = package_cache_key(inputs)
+    return keys, all_inputs
+
+def store_in_cache(package : Package, key : str) -> None:
+    entry = cache_folder / key
+    if entry.exists():
+        return
+    cache_folder.mkdir(parents=True, exist_ok=True)
+    staging = cache_folder / f'{key}.tmp'
+    if staging.exists():
+        shutil.rmtree(staging)
+    shutil.copytree(package.install_location(), staging / 'tree', symlinks=True)
+    entry_info = {
+        'name': package.name,
+        'version': package.version,
+        'extract_folder': Path(package.extract_location).name
+    }
+    (staging / 'entry.json').write_text(json.dumps(entry_info, indent=2))
+    staging.rename(entry)
+    print(f"{package.name} stored in build cache.")
+
+def restore_from_cache(package : Package, key : str, key_file : Path) -> bool:
+    entry = cache_folder / key
+    if not (entry / 'entry.json').exists():
+        return False
+    entry_info = json.loads((entry / 'entry.json').read_text())
+    package.extract_location = build_folder / entry_info['extract_folder']
+    target = package.install_location()
+    if read_key_file(key_file).get('key')==key and target.exists():
+        print(f"{package.name} already built.")
+        return True
+
+    key_file.unlink(missing_ok=True)
+    if target.exists():
+        folder_recursive_delete(target)
+    shutil.copytree(entry / 'tree', target, symlinks=True)
+    write_key_file(package, key_file, key)
+    print(f"{package.name} restored from build cache.")
+    return True
+
+bundle_placeholder = '@CYCLES_DEPENDENCIES_BUILD@'
+bundle_placeholder_posix = '@CYCLES_DEPENDENCIES_BUILD_POSIX@'
+
+def bundle_location(bundles_folder : Path, package : Package, key : str) -> Path:
+    return bundles_folder / f'{package.name.lower()}-{key}'
+
+def bundle_substitutions(folder : Path) -> List[Tuple[bytes, bytes]]:
+    substitutions = [(f"{folder}".encode('utf-8'), bundle_placeholder.encode('utf-8'))]
+    if folder.as_posix()!=f"{folder}":
+        substitutions.append((folder.as_posix().encode('utf-8'), bundle_placeholder_posix.encode('utf-8')))
+    return substitutions
+
+def relocated_content(path : Path) -> Optional[bytes]:
+    if path.stat().st_size>bundle_relocate_limit:
+        return None
+    data = path.read_bytes()
+    if b'\0' in data:
+        return None
+    relocated = data
+    for original, placeholder in bundle_substitutions(build_folder):
+        relocated = relocated.replace(original, placeholder)
+    return relocated if relocated!=data else None
+
+bundle_relocate_limit = 16 * 1024 * 1024
+
+def file_sha256(path : Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def write_bundle_part(part_path : Path, root : Path, names : List[str]) -> Dict[str, Dict]:
+    files = dict()
+    with tarfile.open(part_path, mode='w:gz', compresslevel=6) as archive:
+        for name in names:
+            path = root / name
+            entry = {'part': part_path.name}
+            if path.is_symlink():
+                entry['link'] = os.readlink(path)
+                archive.add(path, arcname=name)
+            else:
+                relocated = relocated_content(path)
+                if relocated is not None:
+                    info = archive.gettarinfo(path, arcname=name)
+                    info.size = len(relocated)
+                    archive.addfile(info, io.BytesIO(relocated))
+                    entry.update(size=len(relocated), sha256=hashlib.sha256(relocated).hexdigest(), relocate=True)
+                else:
+                    archive.add(path, arcname=name)
+                    entry.update(size=path.stat().st_size, sha256=file_sha256(path), relocate=False)
+            files[name] = entry
+    return files
+
+def bundle_package(package : Package) -> None:
+    if not args.bundles:
+        return
+    key = cache_keys[package.name.lower()]
+    bundle = bundle_location(args.bundles, package, key)
+    if (bundle / 'manifest.json').exists():
+        return
+    root = package.install_location()
+    names = sorted(path.relative_to(root).as_posix() for path in root.rglob('*')
+                   if path.is_symlink() or path.is_file())
+    sizes = {name: 0 if (root / name).is_symlink() else (root / name).stat().st_size for name in names}
+    part_count = max(1, min(args.cpus, len(names)))
+    parts : List[List[str]] = [list() for _ in range(part_count)]
+    part_sizes = [0] * part_count
+    for name in sorted(names, key=lambda n: -sizes[n]):
+        smallest = part_sizes.index(min(part_sizes))
+        parts[smallest].append(name)
+        part_sizes[smallest] += sizes[name]
+
+    args.bundles.mkdir(parents=True, exist_ok=True)
+    staging = bundle.with_name(f'{bundle.name}.tmp')
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir()
+    files = dict()
+    with cpu_slots(package.name, part_count) as slots, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=slots) as compressor:
+        written = [compressor.submit(write_bundle_part, staging / f'part-{i:03}.tar.gz', root, part)
+                   for i, part in enumerate(parts)]
+        for future in written:
+            files.update(future.result())
+    manifest = {
+        'name': package.name,
+        'version': package.version,
+        'key': key,
+        'inputs': cache_inputs[package.name.lower()],
+        'extract_folder': Path(package.extract_location).name,
+        'install_folder': package.install_folder,
+        'parts': [f'part-{i:03}.tar.gz' for i in range(part_count)],
+        'files': files
+    }
+    (staging / 'manifest.json').write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    staging.rename(bundle)
+    add_to_report(package.name, 'bundle_bytes', sum((bundle / part).stat().st_size for part in manifest['parts']))
+    print(f"{package.name} bundled.")
+
+def extract_bundle_part(part_path : Path, target : Path, files : Dict[str, Dict]) -> List[str]:
+    extracted = list()
+    with tarfile.open(part_path, mode='r:gz') as archive:
+        for member in archive:
+            parts = PurePosixPath(member.name).parts
+            if member.name.startswith('/') or '..' in parts or member.name not in files:
+                raise Exception(f"Refusing to extract {member.name} from {part_path}.")
+            path = target / member.name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if member.issym():
+                os.symlink(member.linkname, path)
+            elif member.isfile():
+                sha = hashlib.sha256()
+                with archive.extractfile(member) as source, open(path, 'wb') as destination:
+                    for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                        sha.update(chunk)
+                        destination.write(chunk)
+                if sha.hexdigest()!=files[member.name]['sha256']:
+                    raise Exception(f"{member.name} in {part_path} does not match its hash.")
+                os.chmod(path, member.mode)
+            else:
+                continue
+            extracted.append(member.name)
+    return extracted
+
+def relocate_bundle_file(path : Path) -> None:
+    data = path.read_bytes()
+    for original, placeholder in bundle_substitutions(build_folder):
+        data = data.replace(placeholder, original)
+    path.write_bytes(data)
+
+def install_from_bundle(package : Package, key : str, key_file : Path) -> bool:
+    bundle = bundle_location(args.from_bundles, package, key)
+    if not (bundle / 'manifest.json').exists():
+        return False
+    manifest = json.loads((bundle / 'manifest.json').read_text())
+    package.extract_location = build_folder / manifest['extract_folder']
+    target = package.install_location()
+    if read_key_file(key_file).get('key')==key and target.exists():
+        print(f"{package.name} already built.")
+        return True
+
+    key_file.unlink(missing_ok=True)
+    build_folder.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=build_folder, prefix=f'{package.name.lower()}-bundle-'))
+    try:
+        files = manifest['files']
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(manifest['parts'])) as extractor:
+            extracted = set()
+            for names in extractor.map(lambda part: extract_bundle_part(bundle / part, staging, files), manifest['parts']):
+                extracted.update(names)
+        missing = set(files) - extracted
+        if missing:
+            raise Exception(f"Bundle {bundle} is missing {len(missing)} files, like {sorted(missing)[0]}.")
+        for name, entry in files.items():
+            if entry.get('relocate'):
+                relocate_bundle_file(staging / name)
+        if target.exists():
+            folder_recursive_delete(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(staging, target)
+    except BaseException:
+        folder_recursive_delete(staging)
+        raise
+    write_key_file(package, key_file, key)
+    print(f"{package.name} installed from bundle.")
+    return True
+
+cache_keys : Dict[str, str] = dict()
+cache_inputs : Dict[str, Dict[str, str]] = dict()
+package_dependents : Dict[str, List[Package]] = dict()
+
+def load_packages(with_cache_keys : bool = True) -> List[Package]:
+    global packages, cache_keys, cache_inputs, package_dependents
+    if len(package_registry)==0:
+        for create in package_creators:
+            package = create()
+            if package.name.lower() in package_registry:
+                raise Exception(f"Package {package.name} registered more than once.")
+            package_registry[package.name.lower()] = package
+            packages.append(package)
+
+        package_dependents = {name: list() for name in package_registry}
+        in_degree : Dict[str, int] = dict()
+        for p in packages:
+            known_dependencies = [d.lower() for d in p.dependencies if d.lower() in package_registry]
+            in_degree[p.name.lower()] = len(known_dependencies)
+            for d in known_dependencies:
+                package_dependents[d].append(p)
+        S = collections.deque(p for p in packages if in_degree[p.name.lower()]==0)
+        L : List[Package] = list()
+        while len(S)>0:
+            n = S.popleft()
+            L.append(n)
+            for m in package_dependents[n.name.lower()]:
+                in_degree[m.name.lower()] -= 1
+                if in_degree[m.name.lower()]==0:
+                    S.append(m)
+        
+        sorted_names = {p.name.lower() for p in L}
+        unsorted_packages = [p for p in packages if p.name.lower() not in sorted_names]
+        packages = L
+
+        if len(unsorted_packages)>0:
+            print("The following packages have missing dependencies:")
+            for ip in unsorted_packages:
+                print(f"{ip.name} - {[d for d in ip.dependencies if d.lower() not in sorted_names]!r}")
+            sys.exit(13)
+
+        apply_package_options()
+    if with_cache_keys and len(cache_keys)==0:
+        cache_keys, cache_inputs = compute_cache_keys(packages)
+    return packages
+
+def select_packages(names : List[str], with_cache_keys : bool = True) -> List[Package]:
+    load_packages(with_cache_keys)
+    if len(names)==0:
+        return packages
+    selected = set()
+    todo = [name.lower() for name in names]
+    while len(todo)>0:
+        name = todo.pop()
+        if name not in package_registry:
+            raise Exception(f"Unknown package {name}.")
+        if name not in selected:
+            selected.add(name)
+            todo.extend(d.lower() for d in package_registry[name].dependencies)
+    return [p for p in packages if p.name.lower() in selected]
+
+def read_key_file(key_file : Path) -> Dict:
+    if not key_file.exists():
+        return dict()
+    try:
+        return json.loads(key_file.read_text())
+    except ValueError:
+        return {'key': key_file.read_text()}
+
+def write_key_file(package : Package, key_file : Path, key : str) -> None:
+    state = {
+        'key': key,
+        'inputs': cache_inputs[package.name.lower()],
+        'extract_folder': Path(package.extract_location).name,
+        'install_folder': package.install_folder
+    }
+    key_file.write_text(json.dumps(state, indent=2))
+
+def changed_inputs(before : Dict[str, str], after : Dict[str, str]) -> List[str]:
+    changes = list()
+    for name in sorted(set(before) | set(after)):
+        if before.get(name)==after.get(name):
+            continue
+        if name.startswith('dependency '):
+            changes.append(f"{name} rebuilt")
+        elif name in ['platform', 'version', 'url', 'install_folder', 'configs'] or name.startswith('option '):
+            changes.append(f"{name} {before.get(name)} -> {after.get(name)}")
+        else:
+            changes.append(f"{name} changed")
+    return changes
+
+def invalidate_changed_packages(packages : List[Package]) -> None:
+    for p in packages:
+        key_file = build_folder / f'{p.name.lower()}.key'
+        state = read_key_file(key_file)
+        if not state or state['key']==cache_keys[p.name.lower()]:
+            continue
+        changes = changed_inputs(state.get('inputs', dict()), cache_inputs[p.name.lower()])
+        print(f"{p.name} changed: {', '.join(changes) if changes else 'no inputs recorded'}")
+        for folder in [state.get('extract_folder'), state.get('install_folder')]:
+            if folder:
+                folder_recursive_delete(build_folder / folder)
+        for patch in p.patches:
+            (build_folder / f'{patch.name}.applied').unlink(missing_ok=True)
+        key_file.unlink()
+
+build_history_file = cache_folder / 'build_history.json'
+history_length = 5
+default_build_estimate = 60.0
+restore_estimate = 5.0
+
+build_history_lock = threading.Lock()
+build_history : Dict[str, List[float]] = dict()
+
+def load_build_history() -> None:
+    if build_history_file.exists():
+        with build_history_lock:
+            build_history.update(json.loads(build_history_file.read_text()))
+
+def record_build_duration(package_name : str, seconds : float) -> None:
+    with build_history_lock:
+        durations = build_history.setdefault(package_name.lower(), list())
+        durations.append(seconds)
+        del durations[:-history_length]
+
+def save_build_history() -> None:
+    cache_folder.mkdir(parents=True, exist_ok=True)
+    with build_history_lock:
+        build_history_file.write_text(json.dumps(build_history, indent=2, sort_keys=True))
+
+def package_outcome(package : Package) -> str:
+    key = cache_keys[package.name.lower()]
+    if not args.clean_build and read_key_file(build_folder / f'{package.name.lower()}.key').get('key')==key:
+        return 'up to date'
+    if args.from_bundles and (bundle_location(args.from_bundles, package, key) / 'manifest.json').exists():
+        return 'restore'
+    if args.build_cache and (cache_folder / key / 'entry.json').exists():
+        return 'restore'
+    return 'build'
+
+def estimated_durations(packages : List[Package]) -> Dict[str, float]:
+    durations = dict()
+    for p in packages:
+        outcome = package_outcome(p)
+        if outcome=='up to date':
+            durations[p.name.lower()] = 0.0
+        elif outcome=='restore':
+            durations[p.name.lower()] = restore_estimate
+        else:
+            history = build_history.get(p.name.lower())
+            durations[p.name.lower()] = statistics.median(history) if history else default_build_estimate
+    return durations
+
+def critical_path_priorities(packages : List[Package], durations : Dict[str, float]) -> Dict[str, float]:
+    priorities = dict()
+    for p in reversed(packages):
+        dependents = package_dependents[p.name.lower()]
+        priorities[p.name.lower()] = durations[p.name.lower()] + max([priorities[q.name.lower()] for q in dependents if q.name.lower() in priorities], default=0.0)
+    return priorities
+
+def build_package(package : Package, fetching : Optional[concurrent.futures.Future] = None) -> None:
+    with timed(package.name, 'total'):
+        key = cache_keys[package.name.lower()]
+        key_file = build_folder / f'{package.name.lower()}.key'
+        with timed(package.name, 'restore'):
+            restored = bool(args.from_bundles) and install_from_bundle(package, key, key_file)
+            restored = restored or (args.build_cache and restore_from_cache(package, key, key_file))
+        if restored:
+            publish_artifacts(package)
+            report_install_size(package)
+            with timed(package.name, 'bundle'):
+                package.prepare_it()
+            print(f"{package.name} ready")
+            return
+
+        print(f"Fetching {package.name}...")
+        with timed(package.name, 'fetch'):
+            if fetching:
+                fetching.result()
+            else:
+                fetch_package(package)
+        if read_key_file(key_file).get('key')==key and package.install_location().exists():
+            publish_artifacts(package)
+            report_install_size(package)
+            with timed(package.name, 'bundle'):
+                package.prepare_it()
+            print(f"{package.name} already built.")
+            return
+
+        build_started = time.monotonic()
+        key_file.unlink(missing_ok=True)
+        print(f"Patching {package.name}...")
+        with timed(package.name, 'patch'):
+            package.patch_it()
+        print(f"Building {package.name}...")
+        with cpu_budget.building():
+            package.build_it()
+        if args.build_cache:
+            with timed(package.name, 'store'):
+                store_in_cache(package, key)
+        write_key_file(package, key_file, key)
+        record_build_duration(package.name, time.monotonic() - build_started)
+        publish_artifacts(package)
+        report_install_size(package)
+        with timed(package.name, 'bundle'):
+            package.prepare_it()
+        print(f"{package.name} ready")
+
+def build_packages(packages : List[Package], jobs : int, download_jobs : int) -> None:
+    priorities = critical_path_priorities(packages, estimated_durations(packages))
+    pending = sorted(packages, key=lambda p: -priorities[p.name.lower()])
+    finished = set()
+    running = dict()
+    failure = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, download_jobs)) as downloader, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        fetching = dict()
+        checked_fetches = set()
+        for p in pending:
+            if package_outcome(p)=='build':
+                fetching[p.name.lower()] = downloader.submit(fetch_package, p)
+        while len(pending)>0 or len(running)>0:
+            if failure is None:
+                ready = [p for p in pending if all(d.lower() in finished for d in p.dependencies)]
+                for p in ready:
+                    pending.remove(p)
+                    running[executor.submit(build_package, p, fetching.get(p.name.lower()))] = p
+            if len(running)==0:
+                break
+            watched = {f: name for name, f in fetching.items() if name not in checked_fetches}
+            done, _ = concurrent.futures.wait(set(running) | set(watched), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future in watched:
+                    checked_fetches.add(watched[future])
+                    if not future.cancelled() and future.exception() is not None:
+                        print(f"Fetching {watched[future]} failed.")
+                        failure = failure or future.exception()
+                    continue
+                p = running.pop(future)
+                if future.exception() is not None:
+                    print(f"Building {p.name} failed.")
+                    failure = failure or future.exception()
+                else:
+                    finished.add(p.name.lower())
+        if failure is not None:
+            downloader.shutdown(cancel_futures=True)
+    if failure is not None:
+        raise failure
+
+def simulate_schedule(packages : List[Package], jobs : int, durations : Dict[str, float], priorities : Dict[str, float]) -> List[Tuple[Package, float, float]]:
+    pending = sorted(packages, key=lambda p: -priorities[p.name.lower()])
+    finished = set()
+    running : List[Tuple[float, str]] = list()
+    schedule = list()
+    now = 0.0
+    while len(pending)>0 or len(running)>0:
+        ready = [p for p in pending if all(d.lower() in finished for d in p.dependencies)]
+        for p in ready[:max(1, jobs) - len(running)]:
+            pending.remove(p)
+            end = now + durations[p.name.lower()]
+            running.append((end, p.name.lower()))
+            schedule.append((p, now, end))
+        running.sort()
+        now = running[0][0]
+        while len(running)>0 and running[0][0]<=now:
+            finished.add(running.pop(0)[1])
+    return schedule
+
+def print_build_plan(packages : List[Package], jobs : int) -> None:
+    load_build_history()
+    durations = estimated_durations(packages)
+    priorities = critical_path_priorities(packages, durations)
+    schedule = simulate_schedule(packages, jobs, durations, priorities)
+    print(f"Build plan for {len(packages)} packages with {jobs} jobs:")
+    for p, start, end in schedule:
+        print(f"  {start:7.0f}s - {end:7.0f}s  {p.name:<12} {package_outcome(p):<10} (critical path {priorities[p.name.lower()]:.0f}s)")
+    wall_seconds = max([end for _, _, end in schedule], default=0.0)
+    print(f"Predicted wall-clock time: {wall_seconds:.0f}s")
+
+def run_build(selected : List[Package]) -> None:
+    global cpu_budget
+    previous_report = json.loads(args.compare.read_text()) if args.compare else None
+    run_started = time.monotonic()
+    cpu_budget = CpuBudget(args.cpus)
+    load_build_history()
+    empty_trash()
+    check_compiler_cache()
+
+    if args.clean_dl:
+        if dl_folder.exists():
+            print(f"Cleaning out {dl_folder}...")
+            folder_recursive_delete(dl_folder)
+            print("... clean complete.")
+        dl_folder.mkdir(parents=True)
+    else:
+        if not dl_folder.exists():
+            dl_folder.mkdir(parents=True)
+        print("Not cleaning out old download results")
+    
+    if args.clean_build:
+        if build_folder.exists():
+            print(f"Cleaning out {build_folder}...")
+            folder_recursive_delete(build_folder)
+            print("... clean complete.")
+        build_folder.mkdir(parents=True)
+    else:
+        if not build_folder.exists():
+            build_folder.mkdir(parents=True)
+        print("Not cleaning out build results")
+
+    invalidate_changed_packages(selected)
+
+    try:
+        verify_patches([p for p in selected if package_outcome(p)=='build'])
+        build_packages(selected, args.jobs, args.download_jobs)
+    finally:
+        report = write_report(args.report, time.monotonic() - run_started)
+        save_build_history()
+        print_compiler_cache_stats()
+        if previous_report:
+            compare_reports(previous_report, report, args.compare)
+
+def set_work_folder(folder : Path) -> None:
+    global dl_folder, build_folder, cache_folder, download_cache_folder, log_folder, trash_folder
+    global compiler_cache_folder, source_store_folder, build_history_file
+    folder = folder.resolve()
+    dl_folder = folder / 'cycles_dependencies_dl'
+    build_folder = folder / 'cycles_dependencies_build'
+    cache_folder = folder / 'cycles_dependencies_cache'
+    download_cache_folder = folder / 'cycles_dependencies_dlcache'
+    log_folder = build_folder / 'logs'
+    trash_folder = folder / 'cycles_dependencies_trash'
+    compiler_cache_folder = folder / 'cycles_dependencies_compiler_cache'
+    source_store_folder = folder / 'cycles_dependencies_sources'
+    build_history_file = cache_folder / 'build_history.json'
+
+bundle_name_pattern = re.compile(r'^[a-z0-9_.+-]+-[0-9a-f]{64}$')
+
+def default_bundles_folder() -> Path:
+    return args.bundles if args.bundles else cache_folder / 'bundles'
+
+def write_bundle_tar(bundle : Path, fileobj : BinaryIO) -> None:
+    with tarfile.open(fileobj=fileobj, mode='w|') as archive:
+        for path in sorted(bundle.iterdir()):
+            archive.add(path, arcname=path.name)
+
+def receive_bundle(fileobj : BinaryIO, bundles_folder : Path, name : str) -> None:
+    bundles_folder.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=bundles_folder, prefix=f'{name}.'))
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+            for member in archive:
+                if not member.isfile() or '/' in member.name or member.name in ['', '.', '..']:
+                    raise Exception(f"Refusing to receive {member.name} in bundle {name}.")
+                with archive.extractfile(member) as source, open(staging / member.name, 'wb') as destination:
+                    shutil.copyfileobj(source, destination)
+        if not (staging / 'manifest.json').exists():
+            raise Exception(f"Bundle {name} has no manifest.")
+        if (bundles_folder / name / 'manifest.json').exists():
+            shutil.rmtree(staging)
+        else:
+            os.rename(staging, bundles_folder / name)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+package_name_pattern = re.compile(r'^[A-Za-z0-9_.+][A-Za-z0-9_.+-]*$')
+
+def worker_build(request : Dict, command : List[str]) -> Tuple[int, Dict]:
+    package_name, key = request.get('package', ''), request.get('key', '')
+    name = f'{package_name.lower()}-{key}'
+    if not package_name_pattern.match(package_name) or not bundle_name_pattern.match(name):
+        return 400, {'error': f"Invalid package {package_name!r} or key {key!r}."}
+    if request.get('compiler_cache') not in [None, 'ccache', 'sccache']:
+        return 400, {'error': f"Invalid compiler cache {request.get('compiler_cache')!r}."}
+    bundles_folder = default_bundles_folder()
+    if (bundles_folder / name / 'manifest.json').exists():
+        return 200, {'bundle': name}
+
+    work_folder = build_folder.parent
+    build_command = [*command, '--work-folder', f"{work_folder}", '--lock-file', f"{lock_file}",
+                     '--bundles', f"{bundles_folder}", '--from-bundles', f"{bundles_folder}",
+                     '--cpus', f"{args.cpus}", '--report', f"{work_folder / 'cycles_dependencies_report.json'}",
+                     *[f'--package-option={option}={value}' for option, value in request.get('options', dict()).items()]]
+    if request.get('multi_config'):
+        build_command.append('--multi-config')
+    if request.get('compiler_cache'):
+        build_command += ['--compiler-cache', request['compiler_cache']]
+    build_command.append(package_name)
+
+    log_file = work_folder / f'{package_name.lower()}-build.log'
+    print(f"Building {package_name}, output in {log_file}...")
+    work_folder.mkdir(parents=True, exist_ok=True)
+    with open(log_file, 'w', encoding='utf-8') as log:
+        returncode = subprocess.run(build_command, stdout=log, stderr=subprocess.STDOUT).returncode
+    if returncode==0 and (bundles_folder / name / 'manifest.json').exists():
+        print(f"{package_name} built.")
+        return 200, {'bundle': name}
+    tail = log_file.read_text(encoding='utf-8', errors='replace').splitlines()[-log_tail_lines:]
+    if returncode==0:
+        return 500, {'error': f"{package_name} was built under a different key than {key}.", 'tail': tail}
+    return 500, {'error': f"Building {package_name} failed.", 'tail': tail}
+
+class LimitedReader:
+    def __init__(self, fileobj : BinaryIO, size : int):
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def read(self, size : int = -1) -> bytes:
+        if size<0 or size>self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+class WorkerHandler(http.server.BaseHTTPRequestHandler):
+    def send_json(self, status : int, value) -> None:
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', f"{len(body)}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def bundle_name(self) -> Optional[str]:
+        name = self.path[len('/bundles/'):]
+        return name if self.path.startswith('/bundles/') and bundle_name_pattern.match(name) else None
+
+    def do_GET(self) -> None:
+        bundles_folder = default_bundles_folder()
+        if self.path=='/bundles':
+            names = [b.name for b in bundles_folder.iterdir() if (b / 'manifest.json').exists()] if bundles_folder.exists() else []
+            self.send_json(200, sorted(names))
+            return
+        name = self.bundle_name()
+        if not name or not (bundles_folder / name / 'manifest.json').exists():
+            self.send_json(404, {'error': f"No bundle {self.path}."})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-tar')
+        self.end_headers()
+        write_bundle_tar(bundles_folder / name, self.wfile)
+
+    def do_PUT(self) -> None:
+        name = self.bundle_name()
+        if not name:
+            self.send_json(404, {'error': f"No bundle {self.path}."})
+            return
+        receive_bundle(LimitedReader(self.rfile, int(self.headers['Content-Length'])), default_bundles_folder(), name)
+        self.send_json(200, {'bundle': name})
+
+    def do_POST(self) -> None:
+        if self.path!='/build':
+            self.send_json(404, {'error': f"No {self.path}."})
+            return
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.build_lock:
+            try:
+                status, result = worker_build(request, self.server.build_command)
+            except Exception as e:
+                status, result = 500, {'error': f"{e}"}
+        self.send_json(status, result)
+
+def serve_worker(port : int, command : List[str]) -> None:
+    server = http.server.ThreadingHTTPServer((args.bind, port), WorkerHandler)
+    server.build_command = command
+    server.build_lock = threading.Lock()
+    print(f"Build worker listening on {args.bind}:{port}, working in {build_folder.parent}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+worker_timeout = 60
+
+@contextlib.contextmanager
+def worker_call(worker : str, method : str, path : str, body=None, headers : Optional[Dict[str, str]] = None, timeout : float = worker_timeout) -> Iterator[http.client.HTTPResponse]:
+    host, _, port = worker.rpartition(':')
+    connection = http.client.HTTPConnection(host, int(port), timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers or dict())
+        yield connection.getresponse()
+    finally:
+        connection.close()
+
+def send_bundle(worker : str, bundle : Path) -> None:
+    with tempfile.TemporaryFile() as tar_file:
+        write_bundle_tar(bundle, tar_file)
+        size = tar_file.tell()
+        tar_file.seek(0)
+        with worker_call(worker, 'PUT', f'/bundles/{bundle.name}', tar_file, {'Content-Length': f"{size}"}) as response:
+            if response.status!=200:
+                raise Exception(f"Sending {bundle.name} to {worker} failed: {response.read().decode('utf-8', errors='replace')}")
+            response.read()
+
+def remote_build(worker : str, package : Package, bundles_folder : Path) -> None:
+    with timed(package.name, 'remote'):
+        with worker_call(worker, 'GET', '/bundles') as response:
+            present = set(json.loads(response.read()))
+        for dependency in select_packages([package.name]):
+            bundle = bundle_location(bundles_folder, dependency, cache_keys[dependency.name.lower()])
+            if dependency is not package and bundle.name not in present:
+                send_bundle(worker, bundle)
+
+        request = {
+            'package': package.name,
+            'key': cache_keys[package.name.lower()],
+            'options': {f'{p.name.lower()}.{name}': option.value for p in packages for name, option in p.options.items()},
+            'multi_config': args.multi_config,
+            'compiler_cache': args.compiler_cache
+        }
+        with worker_call(worker, 'POST', '/build', json.dumps(request), {'Content-Type': 'application/json'}, args.worker_build_timeout) as response:
+            result = json.loads(response.read())
+            if response.status!=200:
+                for line in result.get('tail', []):
+                    print(f"  {worker}: {line}")
+                raise Exception(f"{worker}: {result['error']}")
+
+        with worker_call(worker, 'GET', f"/bundles/{result['bundle']}") as response:
+            if response.status!=200:
+                raise Exception(f"Fetching {result['bundle']} from {worker} failed.")
+            receive_bundle(response, bundles_folder, result['bundle'])
+
+def distributed_build(selected : List[Package], workers : List[str]) -> None:
+    bundles_folder = default_bundles_folder()
+    load_build_history()
+    priorities = critical_path_priorities(selected, estimated_durations(selected))
+    finished = {p.name.lower() for p in selected
+                if (bundle_location(bundles_folder, p, cache_keys[p.name.lower()]) / 'manifest.json').exists()}
+    pending = sorted([p for p in selected if p.name.lower() not in finished], key=lambda p: -priorities[p.name.lower()])
+    idle = list(workers)
+    running = dict()
+    failure = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        while len(pending)>0 or len(running)>0:
+            if failure is None:
+                ready = [p for p in pending if all(d.lower() in finished for d in p.dependencies)]
+                for p in ready[:len(idle)]:
+                    worker = idle.pop(0)
+                    pending.remove(p)
+                    print(f"Building {p.name} on {worker}...")
+                    running[executor.submit(remote_build, worker, p, bundles_folder)] = (p, worker)
+            if len(running)==0:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                p, worker = running.pop(future)
+                idle.append(worker)
+                if future.exception() is not None:
+                    print(f"Building {p.name} on {worker} failed.")
+                    failure = failure or future.exception()
+                else:
+                    finished.add(p.name.lower())
+                    print(f"{p.name} built on {worker}.")
+    if failure is not None:
+        raise failure
+
+    args.from_bundles = bundles_folder
+    run_build(selected)
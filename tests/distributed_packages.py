@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, f"{Path(__file__).resolve().parent.parent}")
+
+import build_cycles_packages
+import cycles_packages
+
+# Small packages that are built with Python alone. Each writes what it was
+# built against, so the tests can see that the dependencies reached the
+# worker that built it.
+
+def acquire(self : cycles_packages.Package) -> None:
+    self.extract_location = cycles_packages.build_folder / f'{self.name}-{self.version}'
+    self.extract_location.mkdir(parents=True, exist_ok=True)
+
+def build(self : cycles_packages.Package) -> None:
+    install_dir = self.install_location()
+    install_dir.mkdir(parents=True, exist_ok=True)
+    used = [(Path(self.dependency(d).root) / 'built.txt').read_text() for d in self.dependencies]
+    (install_dir / 'built.txt').write_text(f"{self.name}({','.join(used)})")
+
+def test_package(name : str, dependencies : list) -> None:
+    def create() -> cycles_packages.Package:
+        return cycles_packages.Package(name, '1', f'http://localhost/{name}.zip', cycles_packages.dl_folder / f'{name}.zip',
+                                       acquire, lambda self: '', lambda self: '', cycles_packages.no_patches, [],
+                                       build, cycles_packages.bundle_package, dependencies, '', f'{name}_install', [], {})
+    create.__name__ = name
+    cycles_packages.register_package(create)
+
+test_package('alpha', [])
+test_package('beta', ['alpha'])
+test_package('gamma', [])
+test_package('delta', ['beta', 'gamma'])
+
+if __name__ == '__main__':
+    build_cycles_packages.main()
@@ -0,0 +1,70 @@
+import json
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import cycles_packages
+
+repository = Path(__file__).resolve().parent.parent
+test_packages = Path(__file__).resolve().parent / 'distributed_packages.py'
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class DistributedBuildTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+
+    def start_worker(self, name : str) -> str:
+        port = free_port()
+        with open(self.folder / f'{name}.log', 'w') as log:
+            process = subprocess.Popen([sys.executable, f"{test_packages}", '--worker', f"{port}", '--work-folder', f"{self.folder / name}"],
+                                       cwd=repository, stdout=log, stderr=subprocess.STDOUT)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.terminate)
+        worker = f'127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                with cycles_packages.worker_call(worker, 'GET', '/bundles') as response:
+                    self.assertEqual(json.loads(response.read()), [])
+                return worker
+            except OSError:
+                if time.monotonic()>deadline or process.poll() is not None:
+                    raise
+                time.sleep(0.1)
+
+    def test_two_workers(self) -> None:
+        workers = [self.start_worker('worker1'), self.start_worker('worker2')]
+        report = self.folder / 'report.json'
+        coordinator = subprocess.run([sys.executable, f"{test_packages}", '--work-folder', f"{self.folder / 'coordinator'}",
+                                      '--report', f"{report}", '--workers', ','.join(workers), 'delta'],
+                                     cwd=repository, capture_output=True, text=True, timeout=300)
+        self.assertEqual(coordinator.returncode, 0, coordinator.stdout + coordinator.stderr)
+
+        installed = self.folder / 'coordinator' / 'cycles_dependencies_build' / 'delta_install' / 'built.txt'
+        self.assertEqual(installed.read_text(), 'delta(beta(alpha()),gamma())')
+        for name in ['worker1', 'worker2']:
+            self.assertTrue(list((self.folder / name).glob('*-build.log')), f"{name} built nothing")
+        built_remotely = [name for name, fields in json.loads(report.read_text())['packages'].items() if 'remote_seconds' in fields]
+        self.assertEqual(sorted(built_remotely), ['alpha', 'beta', 'delta', 'gamma'])
+
+        # with all bundles in place nothing is sent to the workers again
+        again = subprocess.run([sys.executable, f"{test_packages}", '--work-folder', f"{self.folder / 'coordinator'}",
+                                '--report', f"{report}", '--workers', ','.join(workers), 'delta'],
+                               cwd=repository, capture_output=True, text=True, timeout=300)
+        self.assertEqual(again.returncode, 0, again.stdout + again.stderr)
+        self.assertNotIn(' on 127.0.0.1', again.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Dict, Optional
+from unittest import mock
+
+import cycles_packages
+
+lines_u3 = """diff --git a/lines.txt b/lines.txt
+--- a/lines.txt
++++ b/lines.txt
+@@ -1,7 +1,8 @@
+ one
+ two
+-three
++THREE
+ four
+ five
++added
+ six
+ seven
+"""
+
+lines_u0 = """diff --git a/lines.txt b/lines.txt
+--- a/lines.txt
++++ b/lines.txt
+@@ -3 +3 @@ two
+-three
++THREE
+@@ -5,0 +6 @@ five
++added
+"""
+
+end_of_file_u3 = """diff --git a/noeol.txt b/noeol.txt
+--- a/noeol.txt
++++ b/noeol.txt
+@@ -1,2 +1,2 @@
+ first
+-last
+\\ No newline at end of file
++last
+diff --git a/ends.txt b/ends.txt
+--- a/ends.txt
++++ b/ends.txt
+@@ -1 +1 @@
+-keep
++keep
+\\ No newline at end of file
+"""
+
+end_of_file_u0 = """diff --git a/noeol.txt b/noeol.txt
+--- a/noeol.txt
++++ b/noeol.txt
+@@ -2 +2 @@ first
+-last
+\\ No newline at end of file
++last
+diff --git a/ends.txt b/ends.txt
+--- a/ends.txt
++++ b/ends.txt
+@@ -1 +1 @@
+-keep
++keep
+\\ No newline at end of file
+"""
+
+created_and_deleted = """diff --git a/src/new.txt b/src/new.txt
+new file mode 100644
+--- /dev/null
++++ b/src/new.txt
+@@ -0,0 +1,2 @@
++brand
++new
+diff --git a/src/old.txt b/src/old.txt
+deleted file mode 100644
+--- a/src/old.txt
++++ /dev/null
+@@ -1,2 +0,0 @@
+-gone
+-for good
+"""
+
+lines = b'one\ntwo\nthree\nfour\nfive\nsix\nseven\n'
+patched_lines = b'one\ntwo\nTHREE\nfour\nfive\nadded\nsix\nseven\n'
+
+
+class PatchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        for name, value in [('build_folder', self.folder / 'build'),
+                            ('lock_file', self.folder / 'cycles_dependencies.lock')]:
+            patcher = mock.patch.object(cycles_packages, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cycles_packages.build_folder.mkdir()
+
+    def patch_file(self, text : str) -> Path:
+        patch_file = self.folder / 'test.patch'
+        patch_file.write_bytes(text.encode('utf-8'))
+        return patch_file
+
+    def patched(self, text : str, sources : Dict[str, bytes]) -> Dict[str, Optional[bytes]]:
+        return cycles_packages.patched_files(self.patch_file(text), sources.get)
+
+    def test_context_and_zero_context_hunks(self) -> None:
+        self.assertEqual(self.patched(lines_u3, {'lines.txt': lines}), {'lines.txt': patched_lines})
+        self.assertEqual(self.patched(lines_u0, {'lines.txt': lines}), {'lines.txt': patched_lines})
+
+    def test_offset_hunks(self) -> None:
+        moved = b'zero\nzero\nzero\n' + lines
+        for patch in [lines_u3, lines_u0]:
+            self.assertEqual(self.patched(patch, {'lines.txt': moved}), {'lines.txt': b'zero\nzero\nzero\n' + patched_lines})
+
+    def test_whitespace_is_ignored_when_matching(self) -> None:
+        spaced = lines.replace(b'two', b'two  ').replace(b'four', b'\tfour')
+        # like patch -l: the hunk is found, and the lines of the patch are written
+        self.assertEqual(self.patched(lines_u3, {'lines.txt': spaced}), {'lines.txt': patched_lines})
+
+    def test_line_endings_and_byte_order_mark_are_kept(self) -> None:
+        bom = '﻿'.encode('utf-8')
+        source = bom + lines.replace(b'\n', b'\r\n')
+        self.assertEqual(self.patched(lines_u3, {'lines.txt': source}),
+                         {'lines.txt': bom + patched_lines.replace(b'\n', b'\r\n')})
+
+    def test_no_newline_at_end_of_file(self) -> None:
+        sources = {'noeol.txt': b'first\nlast', 'ends.txt': b'keep\n'}
+        expected = {'noeol.txt': b'first\nlast\n', 'ends.txt': b'keep'}
+        self.assertEqual(self.patched(end_of_file_u3, sources), expected)
+        self.assertEqual(self.patched(end_of_file_u0, sources), expected)
+
+    def test_created_and_deleted_files(self) -> None:
+        tree = self.folder / 'tree'
+        (tree / 'src').mkdir(parents=True)
+        (tree / 'src' / 'old.txt').write_bytes(b'gone\nfor good\n')
+        package = cycles_packages.Package('test', '1', 'http://localhost/test.zip', self.folder / 'test.zip',
+                                          None, None, None, cycles_packages.apply_patches, [self.patch_file(created_and_deleted)],
+                                          None, None, [], tree, '', [], {})
+        package.patch_it()
+        self.assertEqual(sorted(p.relative_to(tree).as_posix() for p in tree.rglob('*')), ['src', 'src/new.txt'])
+        self.assertEqual((tree / 'src' / 'new.txt').read_bytes(), b'brand\nnew\n')
+
+    def test_created_file_must_not_exist(self) -> None:
+        with self.assertRaisesRegex(Exception, 'already exists'):
+            self.patched(created_and_deleted, {'src/new.txt': b'x\n', 'src/old.txt': b'gone\nfor good\n'})
+
+    def test_deleted_file_must_be_removed_completely(self) -> None:
+        with self.assertRaisesRegex(Exception, 'not all of it is removed'):
+            self.patched(created_and_deleted, {'src/old.txt': b'gone\nfor good\nand more\n'})
+
+    def test_patch_that_does_not_apply_changes_nothing(self) -> None:
+        tree = self.folder / 'tree'
+        tree.mkdir()
+        (tree / 'noeol.txt').write_bytes(b'first\nlast')
+        (tree / 'ends.txt').write_bytes(b'something else\n')
+        package = cycles_packages.Package('test', '1', 'http://localhost/test.zip', self.folder / 'test.zip',
+                                          None, None, None, cycles_packages.apply_patches, [self.patch_file(end_of_file_u3)],
+                                          None, None, [], tree, '', [], {})
+        with self.assertRaisesRegex(Exception, 'does not apply to ends.txt'):
+            package.patch_it()
+        self.assertEqual((tree / 'noeol.txt').read_bytes(), b'first\nlast')
+        self.assertFalse(cycles_packages.patch_applied_marker(package.patches[0]).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()